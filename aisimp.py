@@ -8,168 +8,391 @@ Created on May 2020
 @author: Callum Gilmour
 
 Imports AIS data supplied from single CSV file curotesy of shipAIS.com
-Scrubs and adds detail from IMO vessel codes
+Raw data is cached in columnar form (aisraw) with spatial index (aisgrid)
+Scrubs (aisscrub) and adds detail from IMO vessel codes (aisimo)
+Destination RegEx run once per unique dest (see destnorm)
+
+Monthly extracts can be appended to the csv (param['aisappend']), each file
+is cached and scrubbed on its own so only a new file is read, scrubbed files
+are then merged (aismerge) as if they were one csv
+Entries are scrubbed one year at a time and unique ship tables
+(review['uship']) found for each year independently, indexed by year then
+month
 
 Discussion of RegEx used can be found in the report
 RegEx visulisations have been included in the regex folder
 """
-import os
-import re
-import pickle as pkl
+from concurrent.futures import ProcessPoolExecutor
 
+import numpy as np
 import pandas as pd
-from imovcimp import imovcimp
+from imovcimp import imovcindex, imovcfind, imovclookup
+from colcache import cachewrite, cacheclose, cachemeta
+from gridindex import gridbuild, gridquery
+from destnorm import destnorm, destload, destsave
+from stagecache import rawkey
+
+# columns of shipAIS csv and types stored in raw cache (dest etc.
+# dictionary encoded), types applied as csv is read (see aiscsv), lat and
+# lon kept float64 so bounds tests (strict, float64 bounds) are exact,
+# float32 holds others given to 1 dp
+RAW_TYPES = {'lat': 'float64', 'lon': 'float64', 'date': 'timestamp',
+             'shipname': 'string', 'MMSI': 'uint32', 'IMO': 'uint32',
+             'callsign': 'string', 'len': 'float32', 'beam': 'float32',
+             'tonnage': 'float32', 'dwt': 'float32', 'heading': 'uint16',
+             'bearing': 'float32', 'speed': 'float32', 'dest': 'string'}
+
+# time zones found in shipAIS dates and offset from UTC (hours)
+ZONES = {'UTC': 0, 'GMT': 0, 'BST': 1}
+# days in each month (non leap year)
+MONTH_DAYS = np.array([31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31])
+
+
+def dateparse(dates):
+
+    # parse dates to UTC (as some BST), format 'YYYY-mm-dd HH:MM:SS ZZZ'
+    # fixed width, so fields are read from the bytes of each string and
+    # converted with numpy rather than parsing value by value
+    missing = dates.isna().to_numpy()
+    # read one byte past format so longer values are not cut to fit, only
+    # ascii can be read as bytes
+    try:
+        text = np.where(missing, '1970-01-01 00:00:00 UTC',
+                        dates.to_numpy()).astype('S24')
+    except UnicodeEncodeError:
+        other = ~dates.map(str.isascii, na_action='ignore').fillna(True)
+        raise ValueError('AIS dates not in shipAIS format: '
+                         + ', '.join(dates[other.astype(bool)].unique()[:5]))
+    char = text.view('u1').reshape(-1, 24)
+    # check length (23), separators are where format expects and other
+    # fields are digits
+    sep = {4: '-', 7: '-', 10: ' ', 13: ':', 16: ':', 19: ' '}
+    bad = (char[:, 22] == 0) | (char[:, 23] != 0)
+    for pos, sym in sep.items():
+        bad |= char[:, pos] != ord(sym)
+    digits = char[:, [pos for pos in range(19) if pos not in sep]]
+    bad |= ((digits < ord('0')) | (digits > ord('9'))).any(axis=1)
+    if bad.any():
+        raise ValueError('AIS dates not in shipAIS format: '
+                         + ', '.join(dates[bad].unique()[:5]))
+    # integer from digits in char[:, start:stop]
+    num = lambda start, stop: (
+        (char[:, start:stop].astype('int64') - ord('0'))
+        @ 10**np.arange(stop-start-1, -1, -1))
+    year, mon, day = num(0, 4), num(5, 7), num(8, 10)
+    hour, minute, sec = num(11, 13), num(14, 16), num(17, 19)
+    # check fields are in range (day within days of month, 29 in February
+    # of leap years)
+    leap = (year % 4 == 0) & ((year % 100 != 0) | (year % 400 == 0))
+    days = MONTH_DAYS[(mon - 1) % 12] + (leap & (mon == 2))
+    bad = ((mon < 1) | (mon > 12) | (day < 1) | (day > days) | (hour > 23)
+           | (minute > 59) | (sec > 59))
+    if bad.any():
+        raise ValueError('AIS dates out of range: '
+                         + ', '.join(dates[bad].unique()[:5]))
+    month = (year - 1970)*12 + mon - 1
+    secs = (day - 1)*86400 + hour*3600 + minute*60 + sec
+    # zone to offset
+    zone = char[:, 20:23].copy().view('S3').ravel()
+    offset = np.full(len(text), -1)
+    for name, hours in ZONES.items():
+        offset[zone == name.encode()] = hours
+    unknown = offset < 0
+    if unknown.any():
+        raise ValueError('Unknown time zone in AIS dates: '
+                         + ', '.join(dates[unknown].str[20:].unique()))
+    stamp = (month.astype('datetime64[M]').astype('datetime64[ns]')
+             + ((secs - offset*3600)*10**9).astype('timedelta64[ns]'))
+    stamp[missing] = np.datetime64('NaT')
+    return pd.Series(stamp, index=dates.index).dt.tz_localize('UTC')
 
 
 def aisimp(param, bounds):
 
-    # if pickle exsists of data retrive it otherwise Import CSV
-    # concatinate area string and file suffix
-    raw_pkl_path = param['datafolder'] / (param['area'] + '_ais_raw.pkl')
-    if os.path.exists(raw_pkl_path):
-        with open(raw_pkl_path, 'rb') as file:
-            ais_data = pkl.load(file)
+    # scrub AIS data of each file then add IMO vessel codes and analyse
+    return aisimo(param, aismerge(
+        param, [aisscrub(dict(param, aisfile=name), bounds)
+                for name in aisfiles(param)]))
+
+
+def aisfiles(param):
+
+    # AIS csv followed by monthly extracts appended to it, in date order
+    return [param['aisfile']] + list(param['aisappend'])
+
+
+def aiscsv(aisfile, chunksize):
+
+    # csv reader, date read as str and parsed by dateparse, text read as
+    # categorical (few distinct names and dest) and floats at raw type
+    types = {'string': 'category', 'float32': np.float32,
+             'float64': np.float64}
+    return pd.read_csv(
+        aisfile, sep="	", names=list(RAW_TYPES), header=None,
+        dtype={'date': str, **{col: types[typ]
+                               for col, typ in RAW_TYPES.items()
+                               if typ in types}},
+        chunksize=chunksize)
+
+
+def destcat(param, dest):
+
+    # dest as categorical with ports as categories (then any other
+    # abbreviation extracted by area RegEx, in sorted order)
+    dest = dest.astype(object)
+    other = sorted(set(dest.dropna()) - set(param['ports']))
+    return dest.astype(pd.CategoricalDtype(list(param['ports']) + other))
+
+
+def aiskey(param):
+
+    # key of raw cache of csv (see rawkey)
+    return rawkey(param['datafolder'] / param['aisfile'], RAW_TYPES)
+
+
+def aisraw(param):
+
+    # build columnar cache of csv (see colcache) if not already built
+    # cache is keyed by csv file (and types) so is shared by areas using the
+    # same file
+    aisfile = param['datafolder'] / param['aisfile']
+    raw_path = param['datafolder'] / 'cache' / ('aisraw_' + aiskey(param))
+    if cachemeta(raw_path) is not None:
+        return raw_path
+
+    if param['aischunk'] is None:
+        # import csv in one go
+        chunks = [aiscsv(aisfile, None)]
     else:
-        col_names = ["lat", "lon", "date", "shipname", "MMSI", "IMO",
-                     "callsign", "len", "beam", "tonnage", "dwt", "heading",
-                     "bearing", "speed", "dest"]
-        # funtion to parse dates to UTC (as some BST) and define format
-        dateparse = lambda x: pd.to_datetime(x, utc=True,
-                                             infer_datetime_format=True,
-                                             format='%Y-%m-%d %H:%M:%S %Z')
-        aisfile = param['datafolder'] / param['aisfile']
-        # import csv
-        ais_data = pd.read_csv(aisfile, sep="	", names=col_names,
-                               header=None, parse_dates=['date'],
-                               date_parser=dateparse, cache_dates=True)
-        with open(raw_pkl_path, 'wb') as file:
-            pkl.dump(ais_data, file)
-
-
-    # record monthly entries
-    ais_review = {'entries': (ais_data[['date', 'IMO']]
-                              .groupby(pd.Grouper(key='date', freq='M'))
-                              .count())}
-    ais_review['entries'].index = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun',
-                                   'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
-    ais_review['entries'].columns = ['Entries']
+        # stream csv in chunks, memory is set by chunk size not file size
+        chunks = aiscsv(aisfile, param['aischunk'])
+
+    # Save info for quality review of filters which don't depend on bounds
+    # accumulated as running totals of length and unique IMO and dest
+    # (unique values kept so files can be merged, see aismerge)
+    tally = {}
+
+    def count(operation, chunk):
+        total = tally.setdefault(operation, [0, set(), set()])
+        total[0] += len(chunk)
+        total[1].update(chunk['IMO'].dropna().unique())
+        total[2].update(chunk['dest'].dropna().unique())
+
+    entries = None
+    for chunkno, chunk in enumerate(chunks):
+        chunk['date'] = dateparse(chunk['date'])
+        # save chunk to cache
+        month = (chunk['date'].dt.year*100 + chunk['date'].dt.month)
+        cachewrite(chunk, raw_path, chunkno, RAW_TYPES, month.fillna(0))
+        # record monthly entries
+        month_entries = (chunk[['date', 'IMO']]
+                         .groupby(pd.Grouper(key='date', freq='M'))
+                         .count())
+        entries = (month_entries if entries is None
+                   else entries.add(month_entries, fill_value=0))
+        count('Orignal', chunk)   # save values before scrubbing
+        # drop entries without IMO codes, all ships over 300gt must have one
+        count('Has IMO code', chunk.query('IMO != 0'))
+
+    # save review with cache, completes cache
+    review_list = [[operation, total[0], np.array(list(total[1])),
+                    np.array(list(total[2]), dtype=object)]
+                   for operation, total in tally.items()]
+    cacheclose(raw_path, {'entries': entries.astype('int64'),
+                          'review': review_list})
+    return raw_path
+
 
+def aisgrid(param):
+
+    # build spatial index of columnar cache (see gridindex) if not already
+    # built, keyed by raw cache and grid cell size
+    raw_path = aisraw(param)
+    grid_path = raw_path.parent / ('aisgrid_%s_%g' % (
+        raw_path.name[len('aisraw_'):], param['gridcell']))
+    return gridbuild(raw_path, grid_path, param['gridcell'])
+
+
+def aisscrub(param, bounds):
+
+    # retrive entries within bounds from spatial index of csv (see
+    # gridindex) so only grid cells covering bounds are read, one year at a
+    # time so only a year of entries is held before scrubbing (entries
+    # without date can't be placed in a year so are dropped)
+    meta = cachemeta(aisraw(param))
+    grid_path = aisgrid(param)
+    # normalise dest not already in lookup table (see destnorm), table
+    # shared by every year
+    dest_cache = destload(param)
+    years = []
+    for year in np.unique(meta['entries'].index.year):
+        start = pd.Timestamp(str(year), tz='UTC')
+        daterange = [start + pd.DateOffset(years=1) - pd.Timedelta(1, 'ns'),
+                     start]
+        years.append(aisscrubyear(param, gridquery(
+            grid_path, bounds=bounds, columns=list(RAW_TYPES),
+            daterange=daterange), dest_cache))
+    destsave(param, dest_cache)
+
+    # monthly entries (labelled by aismerge), csv rows to number rows of
+    # next file
+    ais_review = {'entries': meta['entries'], 'rows': meta['review'][0][1]}
+    # dest lookup table hits and misses for this run
+    ais_review['dest cache'] = dest_cache['run']
+    # years in csv order
+    ais_data = pd.concat([ais_year['data'] for ais_year in years])
+    ais_data['dest'] = destcat(param, ais_data['dest'])
+    review_list = list(meta['review']) + reviewmerge(
+        [ais_year['filtering'] for ais_year in years])
+    return {'data': ais_data.sort_index(kind='mergesort'),
+            'review': ais_review, 'filtering': review_list}
+
+
+def aisscrubyear(param, ais_data, dest_cache):
+
+    # scrub a year of entries within bounds
+    ais_data = ais_data[ais_data['IMO'] != 0]
 
     # Begin scrubbing
-    # Save info for quality review
+    # Save info for quality review, unique IMO and dest kept so years and
+    # files can be merged (counted by aisimo)
     review_list = []
-    review = lambda operation: review_list.append([operation, len(ais_data),
-                                                   ais_data['IMO'].nunique(),
-                                                   ais_data['dest'].nunique()])
-    review('Orignal')   # save values before scrubbing
-    # drop entries without IMO codes, all ships over 300gt must have one
-    ais_data.query('IMO != 0', inplace=True)
-    review('Has IMO code')
-    # remove entries outside bounds
-    ais_data.query('lat < @bounds[0] and lat > @bounds[2] '
-                   'and lon < @bounds[1] and lon > @bounds[3]',
-                   inplace=True)
+    review = lambda operation: review_list.append(
+        [operation, len(ais_data), ais_data['IMO'].unique(),
+         ais_data['dest'].dropna().unique()])
+    # entries outside bounds already removed
     review('Within test boundaries')
+    dest_table = destnorm(ais_data['dest'], param, dest_cache)
     # remove work boats, and dest with more then 2 ?
-    ais_data = ais_data[ais_data['dest'].str.contains(param['ignore'],
-                                                      regex=True) == False]
+    ais_data = ais_data[ais_data['dest'].map(dest_table['ignore']) == False]
     review('Not a utility vessel')
+
     # dest must mention target port(s)
-    ais_data = ais_data[ais_data['dest'].str.contains(
-        param['targetport'], regex=True) == True]
+    ais_data = ais_data[ais_data['dest'].map(dest_table['targetport'])
+                        == True]
     review('Ref to target port in dest')
-    # remove qualifiers
-    reg = re.compile(param['qualifiers'])
-    ais_data['dest'].replace(reg, '', inplace=True)
-    review('Drop qualifiers')
-    # Replace full names with abbreviation
-    reg = re.compile(param['abrv'])
-    ais_data['dest'].replace(reg, r'\1\2\3', inplace=True)
-    review('Substitute abbreviation')
-    # Target ports as destination
-    reg = re.compile(param['are dest'])
-    ais_data['dest'].replace(reg, r'\2', inplace=True)
-    review('Sub abbr if correct dest')
+    # RegEx substitutions don't drop entries so review only needs unique
+    # values of each stage for dests still present
+    present = dest_table.loc[ais_data['dest'].unique()]
+    uniq_imo = ais_data['IMO'].unique()
+    stages = {'qualifiers': 'Drop qualifiers',  # remove qualifiers
+              'abrv': 'Substitute abbreviation',  # full names to abrv
+              'are dest': 'Sub abbr if correct dest'}  # ports as dest
+    for stage, operation in stages.items():
+        review_list.append([operation, len(ais_data), uniq_imo,
+                            present[stage].dropna().unique()])
     # Extract correct values (abvr at end)
-    ais_data = ais_data[ais_data['dest'].str.match(param['extract'])]
+    ais_data = ais_data[ais_data['dest'].map(dest_table['extract']) == True]
+    ais_data['dest'] = destcat(param, ais_data['dest'].map(
+        dest_table['are dest']))
     review('Drop other entries')
     # remove spaces ' ' from callsign
     ais_data['callsign'].replace(' ', '', inplace=True)
 
+    return {'data': ais_data, 'filtering': review_list}
+
+
+def reviewmerge(review_lists):
+
+    # merge review lists of parts (years or files) with the same
+    # operations, lengths added and unique IMO and dest combined
+    union = lambda values: pd.unique(np.concatenate(values))
+    return [[row[0][0], sum(part[1] for part in row),
+             union([part[2] for part in row]),
+             union([part[3] for part in row])]
+            for row in zip(*review_lists)]
+
+
+def aismerge(param, ais_scrubs):
+
+    # merge scrubbed files (in aisfiles order) as if they were one csv
+    # rows numbered on from previous files, review totals added and unique
+    # IMO and dest combined
+    rows, data = 0, []
+    for ais_scrub in ais_scrubs:
+        data.append(ais_scrub['data'].set_axis(
+            ais_scrub['data'].index + rows, axis=0))
+        rows += ais_scrub['review']['rows']
+    review_list = reviewmerge([ais_scrub['filtering']
+                               for ais_scrub in ais_scrubs])
+
+    ais_review = {'entries': None, 'dest cache': {}}
+    for ais_scrub in ais_scrubs:
+        entries = ais_scrub['review']['entries']
+        ais_review['entries'] = (
+            entries if ais_review['entries'] is None
+            else ais_review['entries'].add(entries, fill_value=0))
+        for key, value in ais_scrub['review']['dest cache'].items():
+            ais_review['dest cache'][key] = (
+                ais_review['dest cache'].get(key, 0) + value)
+    # monthly entries labelled by year and month name
+    entries = ais_review['entries'].astype('int64')
+    entries.index = pd.MultiIndex.from_arrays(
+        [entries.index.year, [param['months'][month - 1]
+                              for month in entries.index.month]],
+        names=['year', None])
+    entries.columns = ['Entries']
+    ais_review['entries'] = entries
+    data = pd.concat(data)
+    data['dest'] = destcat(param, data['dest'])
+    return {'data': data, 'review': ais_review, 'filtering': review_list}
+
+
+def aisimo(param, ais_scrub):
+
+    # continue from scrubbed data, copy review so ais_scrub is unchanged
+    ais_data = ais_scrub['data']
+    ais_review = dict(ais_scrub['review'])
+    review_list = list(ais_scrub['filtering'])
+    review = lambda operation: review_list.append(
+        [operation, len(ais_data), ais_data['IMO'].unique(),
+         ais_data['dest'].dropna().unique()])
+
     # Create ship details data frame and strip back main df
     ais_ships = ais_data[['IMO', 'shipname', 'MMSI', 'callsign', 'len', 'beam',
                           'tonnage', 'dwt']].drop_duplicates(subset='IMO')
-    # Read IMO Vessel Codes file and import scrubbed data frame
-    imovcfile = param['datafolder'] / param['imovcfile']
-    imovc = imovcimp(imovcfile)
-    # Merge with 'type and flag' columns from IMO Vessel Codes df
-    ais_ships = ais_ships.merge(imovc[['IMO', 'type', 'flag']],
-                                on='IMO', how='left')
-    ais_ships.dropna(subset=['type'], inplace=True)
+    # Look up 'type and flag' in IMO Vessel Codes index (see imovcindex)
+    imovc = imovcindex(param)
+    found, ship_type, flag = imovclookup(imovc, ais_ships['IMO'].values)
+    ais_ships = ais_ships.reset_index(drop=True).assign(type=ship_type,
+                                                        flag=flag)[found]
     # drop unneed columns from data for stripped back ship location
     ais_data = ais_data.drop(['shipname', 'MMSI', 'callsign', 'len', 'beam',
                               'tonnage', 'dwt'], axis=1)
-    # drop entries in ship_loc where ships are not in ship_det
-    ais_data = ais_data[ais_data['IMO'].isin(ais_ships['IMO'])]
+    # drop entries in ship_loc where ships are not in IMO Vessel Codes
+    ais_data = ais_data[imovcfind(imovc, ais_data['IMO'].values) >= 0]
     review('IMO Vessel Codes')
 
     # convert review_list to df to return
     review_cols = ['operation', 'len', 'uniqships', 'uniqdest']
-    ais_review['filtering'] = pd.DataFrame(review_list, columns=review_cols)
+    ais_review['filtering'] = pd.DataFrame(
+        [[operation, length, len(imo), len(dest)]
+         for operation, length, imo, dest in review_list],
+        columns=review_cols)
 
 
-    # Determine unique ships by month and port
-    # unique to year
-    data = (ais_data[['date', 'IMO', 'dest']].drop_duplicates(subset='IMO'))
-    year_uship = {}
-    # loop over ports calculating monthly unique ships
-    for port in param['ports']:
-        year_uship[port] = ((data[['date', 'IMO']][data['dest'] == port])
-                            .groupby(pd.Grouper(key='date', freq='M'))
-                            .count())
-        if len(year_uship[port]) != 12:  # chek dataframes include values
-            year_uship.pop(port)
-            continue
-        year_uship[port].index = param['months']
-    year_uship = pd.concat(year_uship, axis=1)
-    year_uship.columns = year_uship.columns.droplevel(-1)
-    # calculate monthly percentage
-    year_uship['Perc'] = round((year_uship.sum(axis=1)/len(data))*100, 1)
-    # Caculate total per port
-    year_uship.loc['sum', :] = round(year_uship.sum())
-
-    # unique to month (i.e. counts each month)
-    data = ais_data[['date', 'IMO', 'dest']].copy(deep=True)
-    data['month'] = data.date.dt.month
-    data['hour'] = data.date.dt.hour
-    data.drop_duplicates(subset=['IMO', 'month'], inplace=True)
-    month_uship_pregroup = data
-    data = (data[['month', 'IMO', 'dest']]
-            .groupby(['month', 'dest'])
-            .count()
-            .reset_index())
-    # format into monthly dataframe
-    month_uship = {}
-    for port in param['ports']:
-        month_uship[port] = (data[data.dest == port]
-                             .reset_index(drop=True)
-                             .drop(columns=['dest', 'month']))
-        if len(month_uship[port]) != 12:
-            month_uship.pop(port)
-            continue
-        month_uship[port].index = param['months']
-        month_uship[port].columns = [port]
-    month_uship = pd.concat(month_uship, axis=1)
-    month_uship.columns = month_uship.columns.droplevel(-1)
-    # calculate monthly percentage
-    month_uship['Perc'] = round((month_uship.sum(axis=1)
-                                 / len(month_uship_pregroup)) * 100, 1)
-    # Caculate total per port
-    month_uship.loc['sum', :] = round(month_uship.sum())
+    # Determine unique ships by month and port for each year, years
+    # computed independently (in a pool of workers if more than one)
+    data = ais_data[['date', 'IMO', 'dest']]
+    year = data['date'].dt.year
+    years = [int(value) for value in np.unique(year.dropna())]
+    parts = (data[year == value] for value in years)
+    months = [list(ais_review['entries'].loc[value].index)
+              for value in years]
+    if len(years) > 1 and param['yearworkers'] != 1:
+        with ProcessPoolExecutor(max_workers=param['yearworkers']) as pool:
+            uships = list(pool.map(ushipyear, [param]*len(years), parts,
+                                   months))
+    else:
+        uships = list(map(ushipyear, [param]*len(years), parts, months))
+    # year-over-year, each table indexed by year then month
+    table = lambda key: pd.concat([uship[key] for uship in uships],
+                                  keys=years, names=['year', None])
+    year_uship, month_uship = table('year_uship'), table('month_uship')
 
-    # Time of day trends
-    hour_ships = month_uship_pregroup[['IMO', 'hour']].groupby('hour').count()
-    hour_ships.columns = ['count']
+    # Time of day trends, over all years
+    hour_ships = (pd.concat([uship['hour'] for uship in uships])
+                  .groupby(level=0).sum().to_frame('count'))
     hour_ships['count adj'] = hour_ships['count']
     hour_ships.loc[0, 'count adj'] = round(
         hour_ships.loc[0, 'count'] -
@@ -183,3 +406,42 @@ def aisimp(param, bounds):
     # collate return dict
     ais_dict = {'data': ais_data, 'ships': ais_ships, 'review': ais_review}
     return ais_dict
+
+
+def ushipyear(param, data, months):
+
+    # unique ships by month and port for a year of entries, months: names
+    # of months of year in AIS (ports with no ships in a month count 0)
+    # unique to year
+    uship = {}
+    first = data.drop_duplicates(subset='IMO')
+    count = lambda data: (data.groupby([data['date'].dt.month,
+                                        data['dest'].astype(object)])
+                          ['IMO'].count()
+                          .unstack(fill_value=0)
+                          .reindex(index=range(1, 13), columns=param['ports'],
+                                   fill_value=0)
+                          .rename(index=dict(enumerate(param['months'], 1)))
+                          .rename_axis(index=None, columns=None)
+                          .loc[months])
+    year_uship = count(first)
+    # calculate monthly percentage
+    year_uship['Perc'] = round((year_uship.sum(axis=1)/len(first))*100, 1)
+    # Caculate total per port
+    year_uship.loc['sum', :] = round(year_uship.sum())
+    uship['year_uship'] = year_uship
+
+    # unique to month (i.e. counts each month)
+    data = data.assign(month=data['date'].dt.month, hour=data['date'].dt.hour)
+    data = data.drop_duplicates(subset=['IMO', 'month'])
+    month_uship = count(data)
+    # calculate monthly percentage
+    month_uship['Perc'] = round((month_uship.sum(axis=1)
+                                 / len(data)) * 100, 1)
+    # Caculate total per port
+    month_uship.loc['sum', :] = round(month_uship.sum())
+    uship['month_uship'] = month_uship
+
+    # Time of day trends, ships (unique to month) by hour
+    uship['hour'] = data.groupby('hour')['IMO'].count()
+    return uship
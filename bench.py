@@ -0,0 +1,396 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+bench
+
+GTN Planning Tool
+Created on May 2020
+@author: Callum Gilmour
+
+Benchmarks for GTN Planning Tool using synthetic data
+Run from command line: python bench.py name [rows]
+Where name is one of the keys in BENCHES (run all if no name given)
+"""
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+
+def timer(func, *args):
+
+    # time single call of func, returns result and seconds
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def peakmem(func, *args):
+
+    # peak memory allocated (bytes) during single call of func (numpy and
+    # python allocations traced), returns result and bytes
+    tracemalloc.start()
+    result = func(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, peak
+
+
+def bench_dateparse(rows=10**7, old_rows=10**6):
+
+    from aisimp import dateparse
+    # synthetic shipAIS dates over 2019, BST during summer time
+    rng = np.random.default_rng(0)
+    secs = rng.integers(0, 365*86400, rows)
+    utc = pd.Timestamp('2019-01-01', tz='UTC') + pd.to_timedelta(secs, 's')
+    bst = ((utc >= pd.Timestamp('2019-03-31 01:00', tz='UTC'))
+           & (utc < pd.Timestamp('2019-10-27 01:00', tz='UTC')))
+    local = utc.tz_localize(None) + pd.to_timedelta(bst.astype(int), 'h')
+    dates = pd.Series(local.strftime('%Y-%m-%d %H:%M:%S')
+                      + np.where(bst, ' BST', ' UTC'))
+
+    # previous parser, per value format inference
+    old = lambda x: pd.to_datetime(x, utc=True, infer_datetime_format=True,
+                                   format='%Y-%m-%d %H:%M:%S %Z')
+    # previous parser is slow, timed on first old_rows and scaled
+    old_rows = min(rows, old_rows)
+    old_res, old_time = timer(old, dates[:old_rows])
+    old_time = old_time*rows/old_rows
+    new_res, new_time = timer(dateparse, dates)
+    print('dateparse: %d rows' % rows)
+    print('  previous   %8.2f s  (timed on %d rows)' % (old_time, old_rows))
+    print('  dateparse  %8.2f s  (x%.1f)' % (new_time, old_time/new_time))
+    # previous parser only agrees for UTC values (BST not understood)
+    utc_rows = ~bst[:old_rows]
+    print('  UTC values equal:',
+          bool((old_res[utc_rows] == new_res[:old_rows][utc_rows]).all()))
+    print('  all values correct:', bool((new_res.values == utc.values).all()))
+
+
+def bench_presmode(rows=10**6, years=4):
+
+    from icoadsagg import codehist, histmode
+    # synthetic present weather codes (WMO 0-99, ~25% missing) at random
+    # times over years, several entries per hour as moored bouys
+    rng = np.random.default_rng(0)
+    hours = years*8760
+    secs = np.sort(rng.integers(0, hours*3600, rows))
+    data = pd.DataFrame({
+        'datetime': pd.Timestamp('2018-01-01') + pd.to_timedelta(secs, 's'),
+        'pres weather': np.where(rng.random(rows) < 0.25, np.nan,
+                                 rng.choice([0, 1, 2, 3, 10, 21, 61, 80],
+                                            rows).astype(float))})
+
+    # previous, pd.Series.mode called once per hour
+    old = lambda: (data.groupby(pd.Grouper(key='datetime', freq='H'))
+                   ['pres weather'].agg(pd.Series.mode))
+
+    def new():
+        # histogram of codes in each hour then modes
+        hour = data['datetime'].values.astype('datetime64[h]').astype(
+            np.int64)
+        hour = hour - hour.min()
+        codes = data['pres weather'].values
+        valid = ~np.isnan(codes)
+        return histmode(*codehist(hour[valid], codes[valid],
+                                  hour.max() + 1))
+    old_res, old_time = timer(old)
+    new_res, new_time = timer(new)
+    print('presmode: %d rows, %d hours' % (rows, len(old_res)))
+    print('  previous   %8.2f s' % old_time)
+    print('  histmode   %8.2f s  (x%.1f)' % (new_time, old_time/new_time))
+    same = all(np.array_equal(np.atleast_1d(a), np.atleast_1d(b))
+               for a, b in zip(old_res, new_res))
+    print('  values equal:', same and len(old_res) == len(new_res))
+
+
+def bench_bounds(boxes=10**4, old_boxes=10**3):
+
+    from geopy import distance
+    from bounds import bounds, boundsbatch, destination, SIDES
+    # synthetic ports around UK with random orientation and size
+    rng = np.random.default_rng(0)
+    latlon = np.column_stack([rng.uniform(49, 61, boxes),
+                              rng.uniform(-8, 2, boxes)])
+    orien = rng.choice(list(SIDES), boxes)
+    size = np.column_stack([rng.uniform(5, 60, boxes),
+                            rng.uniform(10, 160, boxes)])
+    # previous, geopy for each box, timed on first old_boxes and scaled
+    old_boxes = min(boxes, old_boxes)
+    old = lambda: [bounds({'portlatlon': tuple(latlon[i]),
+                           'portorien': orien[i]}, tuple(size[i]))
+                   for i in range(old_boxes)]
+    old_res, old_time = timer(old)
+    old_time = old_time*boxes/old_boxes
+    new_res, new_time = timer(boundsbatch, latlon, orien, size)
+    print('bounds: %d boxes' % boxes)
+    print('  previous   %8.3f s  (timed on %d boxes)' % (old_time, old_boxes))
+    print('  boundsbatch %7.3f s  (x%.1f)' % (new_time, old_time/new_time))
+    print('  rounded bounds equal: %d of %d' % (
+        (np.array(old_res) == new_res[:old_boxes]).all(axis=1).sum(),
+        old_boxes))
+    # unrounded error (m) against geopy for points along each bearing
+    dist = size[:old_boxes, 0]*1.852
+    error = 0
+    for brg in [0, 90, 180, 270]:
+        lat, lon = destination(latlon[:old_boxes, 0], latlon[:old_boxes, 1],
+                               brg, dist)
+        points = [distance.GeodesicDistance(d).destination(tuple(loc), brg)
+                  for loc, d in zip(latlon[:old_boxes], dist)]
+        error = max(error, max(distance.geodesic(point, (la, lo)).m
+                               for point, la, lo in zip(points, lat, lon)))
+    print('  max error against geopy: %.2e m' % error)
+
+
+def bench_memory(rows=10**6, ships=2000):
+
+    import io
+    from aisimp import RAW_TYPES, aiscsv, dateparse, destcat
+    from imovcimp import TYPES
+    # synthetic shipAIS csv (as aisShips.com, tab separated no header)
+    rng = np.random.default_rng(0)
+    ship = rng.integers(0, ships, rows)
+    ports = ['IMM', 'GOO', 'GRI', 'HUL']
+    dests = np.array(['IMMINGHAM', 'GOOLE', 'GRIMSBY', 'HULL', 'ROTTERDAM',
+                      'HAMBURG', 'TUG', 'PILOT'], dtype=object)
+    secs = np.sort(rng.integers(0, 365*86400, rows))
+    raw = pd.DataFrame({
+        'lat': rng.uniform(53, 54.5, rows).round(5),
+        'lon': rng.uniform(-1, 1.5, rows).round(5),
+        'date': (pd.Timestamp('2019-01-01') + pd.to_timedelta(secs, 's'))
+        .strftime('%Y-%m-%d %H:%M:%S') + ' UTC',
+        'shipname': ['SHIP %d' % num for num in ship],
+        'MMSI': 235000000 + ship, 'IMO': 9000000 + ship,
+        'callsign': ['C%d' % num for num in ship],
+        'len': (50 + ship % 250).astype(float),
+        'beam': (10 + ship % 40).astype(float),
+        'tonnage': (1000. + ship*7), 'dwt': (2000. + ship*11),
+        'heading': rng.integers(0, 360, rows),
+        'bearing': rng.uniform(0, 360, rows).round(1),
+        'speed': rng.uniform(0, 20, rows).round(1),
+        'dest': dests[ship % len(dests)]})
+    text = io.StringIO()
+    raw.to_csv(text, sep='\t', header=False, index=False)
+    per_row = lambda data: data.memory_usage(deep=True).sum() / len(data)
+
+    # previous: types inferred by read_csv (float64 and int64), text as
+    # object, dest as object and type as object
+    text.seek(0)
+    old_raw = pd.read_csv(text, sep='\t', names=list(RAW_TYPES), header=None,
+                          dtype={'date': str, 'dest': str})
+    text.seek(0)
+    new_raw = aiscsv(text, None)
+    # dates parsed as in aisraw
+    for data in [old_raw, new_raw]:
+        data['date'] = dateparse(data['date'])
+    # scrubbed: dest of entries going to a port as abbreviation
+    scrub_cols = ['lat', 'lon', 'IMO', 'heading', 'bearing', 'speed', 'dest']
+    to_port = ship % len(dests) < len(ports)
+    old_scrub = old_raw.loc[to_port, scrub_cols].assign(
+        dest=np.array(ports, dtype=object)[ship[to_port] % len(dests)])
+    new_scrub = new_raw.loc[to_port, scrub_cols].assign(
+        dest=destcat({'ports': ports}, old_scrub['dest']))
+    # ships: one row per IMO with type from IMO vessel codes
+    ship_cols = ['IMO', 'shipname', 'MMSI', 'callsign', 'len', 'beam',
+                 'tonnage', 'dwt']
+    types = np.array(TYPES, dtype=object)[
+        rng.integers(0, len(TYPES), ships)]
+    old_ships = old_raw[ship_cols].drop_duplicates(subset='IMO')
+    old_ships = old_ships.assign(type=types[old_ships['IMO'] - 9000000])
+    # (names and callsign of scrubbed entries are text, see gridquery)
+    new_ships = (new_raw[ship_cols].drop_duplicates(subset='IMO')
+                 .astype({'shipname': object, 'callsign': object}))
+    new_ships = new_ships.assign(type=pd.Categorical(
+        types[new_ships['IMO'] - 9000000], categories=TYPES))
+
+    print('memory: %d rows, %d ships (bytes per row)' % (rows, ships))
+    print('  %-10s %10s %10s' % ('frame', 'previous', 'compact'))
+    for name, old, new in [('raw', old_raw, new_raw),
+                           ('scrubbed', old_scrub, new_scrub),
+                           ('ais_ships', old_ships, new_ships)]:
+        print('  %-10s %10.1f %10.1f  (x%.1f)' % (
+            name, per_row(old), per_row(new), per_row(old)/per_row(new)))
+
+
+def bench_imovc(rows=10**6, codes=10**5):
+
+    import tempfile
+    from pathlib import Path
+    from imovcimp import imovcimp, imovcindex, imovcfind, imovclookup
+    # synthetic IMO vessel codes csv (as warrantgroup list) and AIS entries
+    # of ships of which about half are in the list
+    rng = np.random.default_rng(0)
+    names = np.array(['Container Ship', 'Ro-Ro Cargo', 'General Cargo',
+                      'Oil Tanker', 'Bulk Carrier', 'Reefer', 'Tug',
+                      'Yacht'], dtype=object)
+    flags = np.array(['United Kingdom', 'Netherlands', 'Panama', 'Liberia',
+                      'Malta'], dtype=object)
+    imovc = pd.DataFrame({'imo': 9000000 + rng.permutation(2*codes)[:codes],
+                          'name': 'SHIP',
+                          'type': names[rng.integers(0, len(names), codes)],
+                          'flag': flags[rng.integers(0, len(flags), codes)]})
+    imo = (9000000 + rng.integers(0, 2*codes, rows)).astype(np.uint32)
+    ais_data = pd.DataFrame({'IMO': imo})
+    ais_ships = ais_data.drop_duplicates(subset='IMO')
+
+    def previous(folder):
+        # csv cleaned each run, merge and isin
+        table = imovcimp(folder / 'imovc.csv')
+        ships = ais_ships.merge(table[['IMO', 'type', 'flag']], on='IMO',
+                                how='left').dropna(subset=['type'])
+        return ships, ais_data[ais_data['IMO'].isin(ships['IMO'])]
+
+    def indexed(param):
+        # index read from cache, lookups by binary search
+        index = imovcindex(param)
+        found, ship_type, flag = imovclookup(index, ais_ships['IMO'].values)
+        ships = ais_ships.reset_index(drop=True).assign(
+            type=ship_type, flag=flag)[found]
+        return ships, ais_data[imovcfind(index, ais_data['IMO'].values) >= 0]
+
+    with tempfile.TemporaryDirectory() as folder:
+        folder = Path(folder)
+        imovc.to_csv(folder / 'imovc.csv', index=False)
+        param = {'datafolder': folder, 'imovcfile': 'imovc.csv'}
+        old, old_time = timer(previous, folder)
+        _, build_time = timer(imovcindex, param)
+        new, new_time = timer(indexed, param)
+    print('imovc: %d codes, %d entries, %d ships' % (codes, rows,
+                                                     len(ais_ships)))
+    print('  csv, merge and isin:  %.3f s' % old_time)
+    print('  build index (once):   %.3f s' % build_time)
+    print('  cached index lookups: %.3f s  (x%.1f)' % (new_time,
+                                                      old_time/new_time))
+    pd.testing.assert_frame_equal(old[0], new[0], check_dtype=False)
+    pd.testing.assert_frame_equal(old[1], new[1])
+
+
+def icoadsdata(rows, years):
+
+    from icoadsagg import aggsummary
+    from icoadsimp import SUMMARY_COLS
+    # synthetic multi-year ICOADS extract, several entries per hour as
+    # moored bouys, values sometimes missing, with hourly summary (found in
+    # icoadsmerge)
+    rng = np.random.default_rng(0)
+    secs = np.sort(rng.integers(0, years*8760*3600, rows))
+    missing = lambda values, frac: np.where(rng.random(rows) < frac, np.nan,
+                                            values)
+    data = pd.DataFrame({
+        'datetime': pd.Timestamp('2015-01-01') + pd.to_timedelta(secs, 's'),
+        'lat': rng.uniform(53, 54, rows), 'lon': rng.uniform(0, 1, rows),
+        'wind speed': missing(rng.gamma(2, 4, rows).round(1), 0.1),
+        'wave height': missing(rng.gamma(2, 0.5, rows).round(1), 0.5),
+        'air temp': missing(rng.normal(10, 5, rows).round(1), 0.2),
+        'vis': missing(rng.choice([90, 92, 94, 96, 97, 98], rows)
+                       .astype(float), 0.4),
+        'sea level pressure': missing(rng.normal(1010, 10, rows), 0.3),
+        'pres weather': missing(rng.choice([0, 1, 2, 3, 10, 21, 61, 80],
+                                           rows).astype(float), 0.3),
+        'nightday': rng.integers(1, 3, rows).astype(float)})
+    return {'data': data,
+            'summary': aggsummary(data, SUMMARY_COLS, 'pres weather')}
+
+
+def bench_flags(rows=2*10**6, years=5):
+
+    from icoadsimp import icoadsflags
+    ic_filt = icoadsdata(rows, years)
+    data, summary = ic_filt['data'], ic_filt['summary']
+    param = {'windlimit': 15, 'vislimit': 92,
+             'goodweather': [0, 1, 2, 3, 4, 10, 11]}
+
+    def previous(param, ic_filt):
+        # flags of each entry with np.select, grouped by hour with pandas
+        # and avg flags from hourly summary
+        flags = data[['datetime', 'lat', 'lon', 'nightday']].copy(deep=True)
+        cond = {'weather': [data['pres weather'].isin(param['goodweather']),
+                            data['pres weather'].isnull()],
+                'vis': [data['vis'] >= param['vislimit'],
+                        data['vis'].isnull()],
+                'wind': [data['wind speed'] <= param['windlimit'],
+                         data['wind speed'].isnull()]}
+        for key, value in cond.items():
+            flags[key] = np.select(value, [True, np.nan], default=False)
+        fhour = (flags[['datetime', 'vis', 'wind', 'weather']]
+                 .groupby(pd.Grouper(key='datetime', freq='H'))
+                 .agg(['all', 'count']).reset_index())
+        fhour[('check', 'every')] = fhour[['vis', 'wind',
+                                           'weather']].all(axis=1)
+        hour = summary['hour']
+        cond = {('vis', 'avg'): [hour[('vis', 'mean')] >= param['vislimit'],
+                                 hour[('vis', 'mean')].isnull()],
+                ('wind', 'avg'): [hour[('wind speed', 'mean')]
+                                  <= param['windlimit'],
+                                  hour[('wind speed', 'mean')].isnull()]}
+        for key, value in cond.items():
+            fhour[key] = np.select(value, [True, np.nan],
+                                   default=False).astype('bool')
+        fhour[('check', 'avg')] = pd.concat(
+            [fhour.xs('avg', axis=1, level=1, drop_level=False),
+             fhour['weather']['all']], axis=1).all(axis=1)
+        fhour.rename(columns={'all': 'flag'}, level=1, inplace=True)
+        return fhour.reindex(columns=['datetime', 'vis', 'wind', 'weather',
+                                      'check'], level=0)
+
+    old_res, old_time = timer(previous, param, ic_filt)
+    new_res, new_time = timer(icoadsflags, param, ic_filt)
+    old_peak = peakmem(previous, param, ic_filt)[1]
+    new_peak = peakmem(icoadsflags, param, ic_filt)[1]
+    print('flags: %d rows, %d years, %d hours' % (rows, years,
+                                                   len(old_res)))
+    print('  %-12s %10s %12s' % ('', 'time (s)', 'peak (MB)'))
+    print('  %-12s %10.3f %12.1f' % ('previous', old_time, old_peak/1e6))
+    print('  %-12s %10.3f %12.1f  (x%.1f time, x%.1f memory)' % (
+        'icoadsflags', new_time, new_peak/1e6, old_time/new_time,
+        old_peak/new_peak))
+    pd.testing.assert_frame_equal(old_res, new_res['hourly flags'])
+    print('  hourly flags equal: True')
+
+
+def bench_sweep(rows=2*10**5, years=5):
+
+    from icoadsimp import icoadsflags, icoadsratio, icoadssweep
+    ic_filt = icoadsdata(rows, years)
+    windlimits, vislimits = [5, 10, 12, 15], [90, 92, 94, 96, 97]
+    weathers = [[0, 1, 2, 3, 4, 10, 11], [0, 1, 2, 3], [0, 1, 2, 3, 61, 80]]
+
+    def previous():
+        # icoadsflags and icoadsratio rerun for each combination
+        ratio = []
+        for wind in windlimits:
+            for vis in vislimits:
+                for weather in weathers:
+                    param = {'windlimit': wind, 'vislimit': vis,
+                             'goodweather': weather}
+                    ratio.append(icoadsratio(icoadsflags(
+                        param, ic_filt))['set']['check'])
+        return pd.DataFrame(ratio)[['avg', 'every']]
+
+    old_res, old_time = timer(previous)
+    new_res, new_time = timer(icoadssweep, ic_filt, windlimits, vislimits,
+                              weathers)
+    print('sweep: %d rows, %d years, %d combinations' % (rows, years,
+                                                         len(new_res)))
+    print('  flags and ratio %8.3f s' % old_time)
+    print('  icoadssweep     %8.3f s  (x%.1f)' % (new_time,
+                                                  old_time/new_time))
+    # same ratio to rounding of sums (matrix product against sum of year)
+    np.testing.assert_allclose(new_res[['avg', 'every']].values,
+                               old_res.values, rtol=1e-12, atol=0)
+    print('  ratios equal: True')
+
+
+# benchmarks available from command line
+BENCHES = {'dateparse': bench_dateparse, 'presmode': bench_presmode,
+           'bounds': bench_bounds, 'memory': bench_memory,
+           'imovc': bench_imovc, 'flags': bench_flags, 'sweep': bench_sweep}
+
+
+if __name__ == '__main__':
+    names = sys.argv[1:2] or list(BENCHES)
+    args = [int(arg) for arg in sys.argv[2:3]]
+    for name in names:
+        BENCHES[name](*args)
@@ -24,9 +24,26 @@ function to calculating bounding box for AIS and ICOADS data filtering
        |       |
        D-------C
            S
+
+boundsbatch gives bounds of many boxes at once, using a vectorised Vincenty
+direct solution on the WGS-84 ellipsoid (agrees with geopy to well under a
+metre)
 """
+import numpy as np
 from geopy import distance
 
+# WGS-84 ellipsoid (m)
+MAJOR = 6378137.0
+FLAT = 1/298.257223563
+MINOR = (1 - FLAT)*MAJOR
+# each side of box [N, E, S, W] for port orientation: None if port loc,
+# else (out, along) multipliers of distance from port along bearing of side
+SIDES = {'N': [None, (0, 1), (1, 0), (0, 1)],
+         'E': [(0, 1), None, (0, 1), (1, 0)],
+         'S': [(1, 0), (0, 1), None, (0, 1)],
+         'W': [(0, 1), (1, 0), (0, 1), None],
+         'mid': [(0.5, 0), (0, 1), (0.5, 0), (0, 1)]}
+
 
 def bounds(param, size):
 
@@ -68,3 +85,66 @@ def bounds(param, size):
                   destlon(along_ea_km, 270)]
 
     return bounds
+
+
+def boundsbatch(latlon, orien, size):
+
+    # bounds [N, E, S, W] of many boxes (as bounds), returns (boxes, 4)
+    # latlon: (boxes, 2) port loc, orien: orientation of each box
+    # size: (boxes, 2) (out, along coast) NM
+    latlon = np.asarray(latlon, dtype=np.float64).reshape(-1, 2)
+    size = np.asarray(size, dtype=np.float64).reshape(-1, 2)
+    orien = np.broadcast_to(np.asarray(orien, dtype=object), len(latlon))
+    out_km = size[:, 0]*1.852
+    along_ea_km = (size[:, 1]*1.852)/2  # conver to km
+    bounds = np.empty((len(latlon), 4))
+    for side, brg in enumerate([0, 90, 180, 270]):
+        # distance along bearing of side (nan if port loc)
+        coef = np.array([SIDES[key][side] or (np.nan, np.nan)
+                         for key in orien]).reshape(-1, 2)
+        dist = coef[:, 0]*out_km + coef[:, 1]*along_ea_km
+        lat, lon = destination(latlon[:, 0], latlon[:, 1], brg, dist)
+        # lat for N and S sides, lon for E and W
+        axis = side % 2
+        bounds[:, side] = np.where(np.isnan(dist), latlon[:, axis],
+                                   [lat, lon][axis])
+    return np.round(bounds, 5)
+
+
+def destination(lat, lon, brg, dist, iters=20):
+
+    # Vincenty direct solution, point reached from lat, lon (deg) along
+    # bearing brg (deg) for dist (km), arrays broadcast together
+    alpha = np.radians(brg)
+    dist = np.asarray(dist, dtype=np.float64)*1000
+    tan_u = (1 - FLAT)*np.tan(np.radians(lat))
+    cos_u = 1 / np.sqrt(1 + tan_u**2)
+    sin_u = tan_u*cos_u
+    sigma1 = np.arctan2(tan_u, np.cos(alpha))
+    sin_a = cos_u*np.sin(alpha)
+    cos2_a = 1 - sin_a**2
+    u2 = cos2_a*(MAJOR**2 - MINOR**2) / MINOR**2
+    big_a = 1 + u2/16384*(4096 + u2*(-768 + u2*(320 - 175*u2)))
+    big_b = u2/1024*(256 + u2*(-128 + u2*(74 - 47*u2)))
+    # iterate for sigma (converges in a few iterations for all but
+    # nearly antipodal points)
+    sigma = dist / (MINOR*big_a)
+    for _ in range(iters):
+        cos_2sm = np.cos(2*sigma1 + sigma)
+        sin_s, cos_s = np.sin(sigma), np.cos(sigma)
+        delta = big_b*sin_s*(cos_2sm + big_b/4*(
+            cos_s*(-1 + 2*cos_2sm**2)
+            - big_b/6*cos_2sm*(-3 + 4*sin_s**2)*(-3 + 4*cos_2sm**2)))
+        sigma = dist / (MINOR*big_a) + delta
+    cos_2sm = np.cos(2*sigma1 + sigma)
+    sin_s, cos_s = np.sin(sigma), np.cos(sigma)
+    tmp = sin_u*sin_s - cos_u*cos_s*np.cos(alpha)
+    lat2 = np.arctan2(sin_u*cos_s + cos_u*sin_s*np.cos(alpha),
+                      (1 - FLAT)*np.sqrt(sin_a**2 + tmp**2))
+    lam = np.arctan2(sin_s*np.sin(alpha),
+                     cos_u*cos_s - sin_u*sin_s*np.cos(alpha))
+    c = FLAT/16*cos2_a*(4 + FLAT*(4 - 3*cos2_a))
+    big_l = lam - (1 - c)*FLAT*sin_a*(
+        sigma + c*sin_s*(cos_2sm + c*cos_s*(-1 + 2*cos_2sm**2)))
+    lon2 = (np.radians(lon) + big_l + np.pi) % (2*np.pi) - np.pi
+    return np.degrees(lat2), np.degrees(lon2)
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+colcache
+
+GTN Planning Tool
+Created on May 2020
+@author: Callum Gilmour
+
+Columnar cache for raw data imported from CSV
+Stored as parquet dataset partitioned by month ('YYYY-MM' folders)
+Written one chunk at a time so whole file is never held in memory
+Reads support column projection and lat/lon/date filters which are pushed
+down to parquet so only required months and row groups are read
+
+Row number of each entry is saved so original CSV order can be restored
+A meta file (e.g. review values) is written last and marks cache complete
+"""
+import os
+import shutil
+import pickle as pkl
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+
+def cachewrite(data, path, chunkno, types, month):
+
+    # remove part written cache (meta file missing) before first chunk
+    if chunkno == 0 and os.path.exists(path):
+        shutil.rmtree(path)
+    # fixed schema so every chunk is stored with the same types
+    # types: {col: pyarrow type name} for every column of data, type of
+    # 'timestamp' columns taken from data (keeps time zone)
+    fields = [pa.Schema.from_pandas(data[[col]], preserve_index=False)
+              .field(col) if typ == 'timestamp'
+              else pa.field(col, pa.type_for_alias(typ))
+              for col, typ in types.items()]
+    schema = pa.schema(fields + [pa.field('row', pa.int64()),
+                                 pa.field('month', pa.string())])
+    # row number (index) and partition column, one folder per month
+    # month: year*100 + month for each row, labelled 'YYYY-MM'
+    codes, inverse = np.unique(np.asarray(month, dtype='int64'),
+                               return_inverse=True)
+    labels = np.array(['%d-%02d' % divmod(code, 100) for code in codes])
+    data = data.assign(row=data.index, month=labels[inverse])
+    table = pa.Table.from_pandas(data, schema=schema, preserve_index=False)
+    pq.write_to_dataset(table, str(path), partition_cols=['month'],
+                        basename_template='part-%05d-{i}.parquet' % chunkno,
+                        version='2.6')
+
+
+def cacheclose(path, meta):
+
+    # write meta, marks cache as complete
+    with open(path / '_meta.pkl', 'wb') as file:
+        pkl.dump(meta, file)
+
+
+def cacheparts(path):
+
+    # part files of cache in month then chunk order, each at most one
+    # chunk of csv
+    return [os.path.join(folder, name)
+            for folder, _, files in sorted(os.walk(path))
+            for name in sorted(files) if name.endswith('.parquet')]
+
+
+def cachecolumns(path):
+
+    # names of data columns in cache (schema of first part file)
+    for part in cacheparts(path)[:1]:
+        names = pq.read_schema(part).names
+        return [col for col in names if col not in ('row', 'month')]
+    return []
+
+
+def cachepart(part, columns):
+
+    # columns (and row) of one part file as dataframe, text read as
+    # dictionary (categorical) rather than python strings
+    schema = pq.read_schema(part)
+    columns = list(columns) + ['row']
+    text = [col for col in columns
+            if pa.types.is_string(schema.field(col).type)]
+    return pq.read_table(part, columns=columns,
+                         read_dictionary=text).to_pandas()
+
+
+def cachemeta(path):
+
+    # retrive meta or None if cache missing or incomplete
+    if not os.path.exists(path / '_meta.pkl'):
+        return None
+    with open(path / '_meta.pkl', 'rb') as file:
+        return pkl.load(file)
+
+
+def cacheread(path, columns=None, bounds=None, daterange=None,
+              filters=None, datecol='date', loccols=('lat', 'lon')):
+
+    # filters in pyarrow form [(col, op, value), ...] all must be true
+    filters = list(filters or [])
+    # bounds [N, E, S, W] as returned by bounds(), loccols: (lat, lon)
+    if bounds is not None:
+        lat, lon = loccols
+        filters += [(lat, '<', bounds[0]), (lat, '>', bounds[2]),
+                    (lon, '<', bounds[1]), (lon, '>', bounds[3])]
+    # daterange [end, start] as icdaterange, months outside are not read
+    if daterange is not None:
+        filters += [('month', '<=', daterange[0].strftime('%Y-%m')),
+                    ('month', '>=', daterange[1].strftime('%Y-%m')),
+                    (datecol, '<=', daterange[0]),
+                    (datecol, '>=', daterange[1])]
+    if columns is not None:
+        columns = list(columns) + ['row']
+    table = pq.read_table(str(path), columns=columns,
+                          filters=filters if filters else None)
+    data = table.to_pandas()
+    # drop partition column and restore CSV row order
+    data = (data.drop(columns='month', errors='ignore')
+            .set_index('row')
+            .sort_index())
+    data.index.name = None
+    return data
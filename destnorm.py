@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+destnorm
+
+GTN Planning Tool
+Created on May 2020
+@author: Callum Gilmour
+
+Normalises AIS destination strings with the area RegEx (see paramimp)
+Each unique dest is run through the RegEx once, giving a lookup table
+indexed by raw dest with the value after each stage, which is then mapped
+back to the AIS entries
+
+Table columns (stages in order applied by aisimp):
+    ignore:     True if utility vessel (ignore RegEx)
+    targetport: True if dest mentions target port(s)
+    qualifiers: dest with qualifiers dropped
+    abrv:       full names replaced with abbreviation
+    are dest:   abbreviation if correct dest
+    extract:    True if final dest is a target port abbreviation
+Replacement stages only filled for dest kept by ignore and targetport
+    used:       run number dest was last looked up (for eviction)
+
+Lookup table is kept on disk between runs in datafolder/destcache, one
+file per area RegEx set (named by hash of RegEx) so areas sharing RegEx
+share results. Least recently used dest are evicted once table is larger
+than param['destcachesize']. Hits (dest already in table) and misses
+(dest run through RegEx) are recorded for the run and in total
+"""
+import os
+import re
+import hashlib
+import pickle as pkl
+
+import pandas as pd
+
+from stagecache import atomicwrite
+
+# RegEx used in normalisation, cache is keyed by these
+REGEX = ['ignore', 'targetport', 'qualifiers', 'abrv', 'are dest', 'extract']
+
+
+def destpath(param):
+
+    # cache file for area RegEx set
+    regex = '\n'.join(param[key] for key in REGEX)
+    key = hashlib.sha1(regex.encode()).hexdigest()[:16]
+    return param['datafolder'] / 'destcache' / (key + '.pkl')
+
+
+def destload(param):
+
+    # retrive lookup table and stats from cache or start new cache
+    path = destpath(param)
+    if os.path.exists(path):
+        with open(path, 'rb') as file:
+            cache = pkl.load(file)
+    else:
+        cache = {'table': None, 'runs': 0,
+                 'total': {'hits': 0, 'misses': 0}}
+    cache['runs'] += 1
+    cache['run'] = {'hits': 0, 'misses': 0}
+    return cache
+
+
+def destsave(param, cache):
+
+    # add run stats to total
+    for key, value in cache['run'].items():
+        cache['total'][key] += value
+    # evict least recently used dest
+    table = cache['table']
+    if table is not None and len(table) > param['destcachesize']:
+        cache['table'] = (table.sort_values('used', kind='mergesort')
+                          .iloc[-param['destcachesize']:])
+    # cache file is always complete (see atomicwrite)
+    atomicwrite(destpath(param), lambda file: pkl.dump(cache, file))
+
+
+def destnorm(dest, param, cache):
+
+    # unique dest, split into those in lookup table and those not
+    table = cache['table']
+    new = pd.Series(dest.dropna().unique(), dtype=object)
+    if table is not None:
+        seen = new.isin(table.index)
+        table.loc[new[seen], 'used'] = cache['runs']
+        cache['run']['hits'] += int(seen.sum())
+        new = new[~seen]
+    cache['run']['misses'] += len(new)
+    norm = pd.DataFrame(index=pd.Index(new, name='dest'))
+    norm['ignore'] = new.str.contains(param['ignore'], regex=True).values
+    norm['targetport'] = new.str.contains(param['targetport'],
+                                          regex=True).values
+    # remaining RegEx only needed for dest kept by the filters
+    keep = (~norm['ignore'] & norm['targetport']).values
+    step = new[keep]
+    # remove qualifiers
+    step = step.replace(re.compile(param['qualifiers']), '')
+    norm.loc[keep, 'qualifiers'] = step.values
+    # Replace full names with abbreviation
+    step = step.replace(re.compile(param['abrv']), r'\1\2\3')
+    norm.loc[keep, 'abrv'] = step.values
+    # Target ports as destination
+    step = step.replace(re.compile(param['are dest']), r'\2')
+    norm.loc[keep, 'are dest'] = step.values
+    # correct values (abvr at end)
+    norm['extract'] = False
+    norm.loc[keep, 'extract'] = step.str.match(param['extract']).values
+    norm['used'] = cache['runs']
+
+    cache['table'] = norm if table is None else pd.concat([table, norm])
+    return cache['table']
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+gridindex
+
+GTN Planning Tool
+Created on May 2020
+@author: Callum Gilmour
+
+Spatial index of positions on a uniform lat/lon grid
+Built from a columnar cache (see colcache) one part file at a time, rows
+are sorted by grid cell (by month then CSV order within each cell) and each
+column saved as a .npy file, with the row range of every cell in a meta file
+(written last, marks index complete)
+Queries (box or polygon) find the cells they cover and read only those rows
+from memory mapped columns, so a new region does not rescan the data
+
+Text columns are saved as codes and categories (-1 missing)
+"""
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+from matplotlib.path import Path
+
+from colcache import (cacheclose, cachemeta, cachecolumns, cachepart,
+                      cacheparts)
+
+
+def gridcell(lat, lon, cell):
+
+    # grid cell number of each lat/lon (cell size in degrees), -1 if
+    # position missing
+    ncols = int(np.ceil(360 / cell))
+    with np.errstate(invalid='ignore'):
+        row = np.floor((np.asarray(lat) + 90) / cell)
+        col = np.floor((np.asarray(lon) + 180) / cell)
+    number = row*ncols + col
+    return np.where(np.isnan(number), -1, number).astype(np.int64)
+
+
+def gridbuild(raw_path, path, cell, loccols=('lat', 'lon')):
+
+    # build index of raw cache at path if not already built
+    # built one part file of raw cache (at most a chunk of csv) at a time so
+    # memory is set by chunk size not file size: cells are counted over
+    # all parts, then rows of each part (sorted by cell) are written into
+    # place in memory mapped columns after rows of earlier parts in the
+    # same cell
+    if cachemeta(path) is not None:
+        return path
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    os.makedirs(path)
+    parts = cacheparts(raw_path)
+    partcells = lambda data: gridcell(data[loccols[0]].values,
+                                      data[loccols[1]].values, cell)
+    # rows in each cell
+    cells, counts = np.array([], dtype=np.int64), np.array([], dtype=np.int64)
+    for part in parts:
+        number, count = np.unique(partcells(cachepart(part, loccols)),
+                                  return_counts=True)
+        cells, inverse = np.unique(np.r_[cells, number], return_inverse=True)
+        counts = np.bincount(inverse, weights=np.r_[counts, count]).astype(
+            np.int64)
+    start = np.cumsum(counts) - counts
+    columns = cachecolumns(raw_path)
+    meta = {'cell': cell, 'loccols': list(loccols), 'cells': cells,
+            'start': start, 'end': start + counts,
+            'types': {col: {} for col in columns}}
+
+    # write rows of each part into place, next free row of each cell in
+    # fill, text as codes of categories found so far (extended by each part)
+    fill = start.copy()
+    categories = {}
+    for partno, part in enumerate(parts):
+        data = cachepart(part, columns)
+        number = partcells(data)
+        order = np.argsort(number, kind='stable')
+        number, count = np.unique(number, return_counts=True)
+        pos = np.searchsorted(cells, number)
+        index = (np.repeat(fill[pos] - np.cumsum(count) + count, count)
+                 + np.arange(len(order)))
+        fill[pos] += count
+        for col in columns + ['row']:
+            values = data[col]
+            if values.dtype.name == 'category':
+                # text as codes and categories
+                # (None added as last category so code -1 gives None)
+                known = categories.get(col, pd.Index([], dtype=object))
+                new = values.cat.categories
+                categories[col] = known.append(new[~new.isin(known)])
+                codes = values.cat.codes.values
+                values = np.where(codes >= 0, categories[col].get_indexer(
+                    new)[codes], -1).astype(np.int32)
+            elif hasattr(values.dtype, 'tz'):
+                # tz aware dates as UTC datetime64
+                meta['types'][col] = {'tz': values.dtype.tz}
+                values = values.values
+            else:
+                values = values.values
+            out = np.lib.format.open_memmap(
+                path / (col + '.npy'), mode='r+' if partno else 'w+',
+                dtype=values.dtype, shape=(int(counts.sum()),))
+            out[index] = values[order]
+            del out
+    for col, known in categories.items():
+        meta['types'][col] = {'categories': np.append(
+            np.asarray(known, dtype=object), None)}
+    cacheclose(path, meta)
+    return path
+
+
+def gridquery(path, bounds=None, polygon=None, columns=None,
+              daterange=None, datecol='date'):
+
+    # rows within bounds [N, E, S, W] (strictly inside, as cacheread) or
+    # polygon [(lat, lon), ...] (or both) as dataframe in CSV row order
+    # daterange [end, start] (inclusive, as cacheread) of datecol, rows
+    # without date dropped
+    meta = cachemeta(path)
+    lat, lon = meta['loccols']
+    columns = list(meta['types']) if columns is None else list(columns)
+    if bounds is None and polygon is None:
+        raise ValueError('gridquery needs bounds or polygon')
+    # box covering query
+    box = [np.inf, np.inf, -np.inf, -np.inf]
+    if bounds is not None:
+        box = list(bounds)
+    if polygon is not None:
+        points = np.asarray(polygon, dtype=np.float64)
+        box = [min(box[0], points[:, 0].max()),
+               min(box[1], points[:, 1].max()),
+               max(box[2], points[:, 0].min()),
+               max(box[3], points[:, 1].min())]
+    # cells covering box and their row ranges
+    first = gridcell(box[2], box[3], meta['cell'])
+    last = gridcell(box[0], box[1], meta['cell'])
+    ncols = int(np.ceil(360 / meta['cell']))
+    rows = np.arange(first // ncols, last // ncols + 1)
+    cols = np.arange(first % ncols, last % ncols + 1)
+    query = (rows[:, None]*ncols + cols[None, :]).ravel()
+    pos = np.searchsorted(meta['cells'], query)
+    found = pos < len(meta['cells'])
+    found[found] = meta['cells'][pos[found]] == query[found]
+    start, end = meta['start'][pos[found]], meta['end'][pos[found]]
+    # position in sorted columns of every row in cells
+    size = end - start
+    index = (np.repeat(start - np.cumsum(size) + size, size)
+             + np.arange(size.sum()))
+    read = lambda col, index: np.load(path / (col + '.npy'),
+                                      mmap_mode='r')[index]
+
+    # exact filter on positions
+    lats, lons = read(lat, index), read(lon, index)
+    keep = np.ones(len(index), dtype=bool)
+    if bounds is not None:
+        keep &= ((lats < bounds[0]) & (lats > bounds[2])
+                 & (lons < bounds[1]) & (lons > bounds[3]))
+    if polygon is not None:
+        keep &= Path(points).contains_points(np.column_stack([lats, lons]))
+    if daterange is not None:
+        # tz aware dates saved as UTC
+        tz = meta['types'][datecol].get('tz')
+        utc = lambda date: (date.tz_convert('UTC').tz_localize(None)
+                            if tz is not None else date).to_datetime64()
+        dates = read(datecol, index)
+        keep &= (dates <= utc(daterange[0])) & (dates >= utc(daterange[1]))
+    index = index[keep]
+    # restore CSV row order
+    row = read('row', index)
+    order = np.argsort(row, kind='stable')
+    index, row = index[order], row[order]
+
+    data = {}
+    for col in columns:
+        values = read(col, index)
+        kind = meta['types'][col]
+        if 'categories' in kind:
+            # missing text as None (as cacheread)
+            values = kind['categories'][values]
+        data[col] = values
+    data = pd.DataFrame(data, index=row)
+    for col in columns:
+        if 'tz' in meta['types'][col]:
+            data[col] = data[col].dt.tz_localize('UTC').dt.tz_convert(
+                meta['types'][col]['tz'])
+    return data
@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+icoadsagg
+
+GTN Planning Tool
+Created on May 2020
+@author: Callum Gilmour
+
+Multi-resolution aggregation for ICOADS summaries and flag ratios
+Statistics are computed once per hour (count, sum, sum of squared deviations
+from hour mean, min, max and histogram of present weather codes) in a single
+pass over the data, then rolled up to day, week, month, year and the whole
+data set without rescanning the data
+Bins and labels match pd.Grouper, so output is the same as groupby().agg()
+Hourly statistics of separate files (e.g. monthly extracts) are merged
+(statsmerge) before rolling up, so only a new file is scanned
+Hourly operational limit flags are summed in the same way (hoursum)
+"""
+import numpy as np
+import pandas as pd
+
+# summary periods and their pd.Grouper freq
+FREQS = {'hour': 'H', 'day': 'D', 'week': 'W', 'month': 'M', 'year': 'Y'}
+# functions reported for each summary col
+FUNCS = ['mean', 'std', 'max', 'min', 'count']
+
+
+def hourstats(data, cols, modecol):
+
+    # hourly statistics of cols (and histogram of modecol codes)
+    # every hour from first to last entry is included (as pd.Grouper)
+    hour = (data['datetime'].values.astype('datetime64[h]')
+            .astype(np.int64))
+    first = hour.min()
+    # entries sorted by hour, order within hour kept (sums as pandas)
+    order = np.argsort(hour, kind='stable')
+    idx = hour[order] - first
+    nhours = idx[-1] + 1
+    stats = {'hours': pd.date_range(pd.Timestamp(first, unit='h'),
+                                    periods=nhours, freq='H'),
+             'count': [], 'sum': [], 'dev': [], 'min': [], 'max': []}
+    for col in cols:
+        values = data[col].values[order]
+        valid = ~np.isnan(values)
+        values, group = values[valid], idx[valid]
+        count = np.bincount(group, minlength=nhours)
+        total = np.bincount(group, weights=values, minlength=nhours)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = total / count
+        dev = np.bincount(group, weights=(values - mean[group])**2,
+                          minlength=nhours)
+        # min and max of each hour with entries, nan otherwise
+        start = np.flatnonzero(np.r_[True, group[1:] != group[:-1]])
+        low, high = np.full(nhours, np.nan), np.full(nhours, np.nan)
+        if len(values):
+            low[group[start]] = np.minimum.reduceat(values, start)
+            high[group[start]] = np.maximum.reduceat(values, start)
+        for key, value in zip(['count', 'sum', 'dev', 'min', 'max'],
+                              [count, total, dev, low, high]):
+            stats[key].append(value)
+    stats = {key: (np.column_stack(value) if key != 'hours' else value)
+             for key, value in stats.items()}
+    # histogram of codes in each hour (nan not counted)
+    codes = data[modecol].values[order]
+    valid = ~np.isnan(codes)
+    stats['hist'], stats['codes'] = codehist(idx[valid], codes[valid],
+                                             nhours)
+    return stats
+
+
+def hoursum(dates, columns):
+
+    # sum of each column for every hour from first to last entry (as
+    # hourstats), reduceat over entries sorted by hour (not copied if
+    # already sorted, as ICOADS extracts are), one column at a time so only
+    # one column is copied at once
+    # returns hours and (hours, columns) sums
+    hour = dates.astype('datetime64[h]').view(np.int64)
+    order = None
+    if not (hour[1:] >= hour[:-1]).all():
+        order = np.argsort(hour, kind='stable')
+        hour = hour[order]
+    idx = hour - hour[0]
+    nhours = idx[-1] + 1
+    start = np.flatnonzero(np.r_[True, idx[1:] != idx[:-1]])
+    total = np.zeros((nhours, len(columns)))
+    for i, column in enumerate(columns):
+        column = column if order is None else column[order]
+        total[idx[start], i] = np.add.reduceat(column, start,
+                                               dtype=np.float64)
+    hours = pd.date_range(pd.Timestamp(hour[0], unit='h'), periods=nhours,
+                          freq='H')
+    return hours, total
+
+
+def statsmerge(parts):
+
+    # merge hourly stats (hourstats) of parts in date order, hours between
+    # parts are empty, None if hours of parts overlap (stats of an hour
+    # need all its entries, so merged data must be used)
+    parts = [stats for stats in parts if stats is not None]
+    first = [stats['hours'][0] for stats in parts]
+    last = [stats['hours'][-1] for stats in parts]
+    if not parts or any(a <= b for a, b in zip(first[1:], last[:-1])):
+        return None
+    hours = pd.date_range(first[0], last[-1], freq='H')
+    codes = parts[0]['codes']
+    for stats in parts[1:]:
+        codes = np.union1d(codes, stats['codes'])
+    ncols = parts[0]['count'].shape[1]
+    merged = {'hours': hours, 'codes': codes,
+              'count': np.zeros((len(hours), ncols), dtype=np.int64),
+              'sum': np.zeros((len(hours), ncols)),
+              'dev': np.zeros((len(hours), ncols)),
+              'min': np.full((len(hours), ncols), np.nan),
+              'max': np.full((len(hours), ncols), np.nan),
+              'hist': np.zeros((len(hours), len(codes)), dtype=np.int64)}
+    for stats in parts:
+        start = hours.get_loc(stats['hours'][0])
+        rows = slice(start, start + len(stats['hours']))
+        for key in ['count', 'sum', 'dev', 'min', 'max']:
+            merged[key][rows] = stats[key]
+        merged['hist'][rows, np.searchsorted(codes, stats['codes'])] = (
+            stats['hist'])
+    return merged
+
+
+def bins(hours, freq):
+
+    # label and position of first hour of each bin, bins as pd.Grouper
+    # (bins all end at day boundaries so hours are never split)
+    # freq None for one bin of all hours
+    if freq is None:
+        return None, np.array([0])
+    size = (pd.Series(0, index=hours)
+            .groupby(pd.Grouper(freq=freq)).size())
+    return size.index, np.cumsum(size.values) - size.values
+
+
+def rollstats(stats, freq):
+
+    # roll hourly stats up to freq
+    labels, start = bins(stats['hours'], freq)
+    roll = lambda key, func=np.add: func.reduceat(stats[key], start, axis=0)
+    count, total = roll('count'), roll('sum')
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = total / count
+        # sum of squared deviations combined using each hours offset from
+        # bin mean (stable, unlike sum of squares)
+        group = np.repeat(np.arange(len(start)),
+                          np.diff(np.r_[start, len(stats['hours'])]))
+        hour_mean = stats['sum'] / stats['count']
+        offset = np.where(stats['count'] > 0,
+                          stats['count']*(hour_mean - mean[group])**2, 0)
+        dev = np.add.reduceat(stats['dev'] + offset, start, axis=0)
+        std = np.where(count > 1, np.sqrt(dev / (count - 1)), np.nan)
+    return {'labels': labels, 'mean': mean, 'std': std,
+            'max': roll('max', np.fmax), 'min': roll('min', np.fmin),
+            'count': count, 'codes': stats['codes'], 'hist': roll('hist')}
+
+
+def codehist(group, codes, ngroups):
+
+    # histogram of codes in each group, returns (ngroups, ncodes) counts
+    # and code of each column (sorted)
+    # present weather codes are small integers (WMO 0-99) so are used as
+    # bins directly, any other codes are numbered in sorted order first
+    if len(codes) and (codes.min() >= 0 and codes.max() < 1000
+                       and (codes == np.round(codes)).all()):
+        inverse = codes.astype(np.int64)
+        labels = np.arange(inverse.max() + 1, dtype=np.float64)
+    else:
+        labels, inverse = np.unique(codes, return_inverse=True)
+    hist = (np.bincount(group*len(labels) + inverse,
+                        minlength=ngroups*len(labels))
+            .reshape(ngroups, len(labels)))
+    return hist, labels
+
+
+def histmode(hist, codes):
+
+    # modes of each row of histogram as pd.Series.mode in groupby agg
+    # ties: every code with the highest count, in ascending order
+    # one mode: value, tied modes: array, no entries: empty array
+    top = hist.max(axis=1, initial=0)
+    row, col = np.nonzero((hist == top[:, None]) & (top[:, None] > 0))
+    nmodes = np.bincount(row, minlength=len(hist))
+    # float column if every row has one mode
+    if (nmodes == 1).all():
+        return codes[col]
+    column = np.empty(len(hist), dtype=object)
+    single = nmodes == 1
+    column[single] = codes[col[single[row]]]
+    modes = np.split(codes[col], np.cumsum(nmodes)[:-1])
+    for i in np.flatnonzero(~single):
+        column[i] = modes[i]
+    return column
+
+
+def aggsummary(data, cols, modecol, stats=None):
+
+    # summary of cols (FUNCS) and modecol (mode and count) for each freq
+    # and whole data set ('set'), returns dict as groupby().agg()
+    # stats: hourly stats of data if already found (see statsmerge)
+    if stats is None:
+        stats = hourstats(data, cols, modecol)
+    summary = {}
+    for key, freq in FREQS.items():
+        roll = rollstats(stats, freq)
+        frame = {('datetime', ''): roll['labels']}
+        for i, col in enumerate(cols):
+            frame.update({(col, func): roll[func][:, i] for func in FUNCS})
+        frame[(modecol, 'mode')] = histmode(roll['hist'], roll['codes'])
+        frame[(modecol, 'count')] = roll['hist'].sum(axis=1)
+        summary[key] = pd.DataFrame(frame)
+    # special case for all values
+    roll = rollstats(stats, None)
+    all_gen = pd.DataFrame({col: [roll[func][0, i] for func in FUNCS]
+                            for i, col in enumerate(cols)}, index=FUNCS,
+                           dtype=np.float64)
+    we_mode = pd.Series(np.atleast_1d(histmode(roll['hist'],
+                                               roll['codes'])[0]),
+                        dtype=np.float64)
+    we_count = roll['hist'].sum()
+    # dataframe with correct col name for pres weather mode and count
+    all_we = pd.DataFrame([we_mode, pd.Series(we_count)],
+                          index=['mode', 'count'])
+    all_we.rename(columns={0: modecol}, inplace=True)
+    summary['set'] = pd.concat([all_gen, all_we], axis=1)
+    return summary
+
+
+def aggratio(fhour):
+
+    # mean of hourly flags for each freq, as groupby().mean()
+    hours = pd.DatetimeIndex(fhour[('datetime', '')])
+    flags = fhour.drop(columns='datetime', level=0)
+    values = flags.to_numpy(dtype=np.float64)
+    valid = ~np.isnan(values)
+    ratio = {}
+    for key, freq in FREQS.items():
+        labels, start = bins(hours, freq)
+        total = np.add.reduceat(np.where(valid, values, 0), start, axis=0)
+        count = np.add.reduceat(valid, start, axis=0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            frame = pd.DataFrame(total / count, columns=flags.columns)
+        frame.insert(0, ('datetime', ''), labels)
+        ratio[key] = frame
+    return ratio
@@ -20,190 +20,344 @@ Weather:    VV (vis), WW (present weather) (see report for details),
             SLP (sea level pressure), AT (air temp)
 Other:      SID (source ID), PT (Platform type), ND (night/day flag),
 UID (unique entry identifier)
+
+Raw data is cached in columnar form (icoadsraw)
+Stages: icoadsfilt (import and filter), icoadsmerge (merge files and
+summarise), icoadsflags (operational limit flags), icoadsratio (ratio of
+operable time), run separately by main so each can be cached
+Monthly extracts can be appended to the CSV (param['icoadsappend']), each
+file is cached and filtered on its own so only a new file is read, then
+merged from totals and hourly statistics of each file
+icoadssweep gives ratio of operable time for a grid of limits at once
 """
 
 import pandas as pd
 import numpy as np
+from colcache import cachewrite, cacheclose, cachemeta, cacheread
+from stagecache import rawkey
+from icoadsagg import (aggsummary, aggratio, bins, codehist, hourstats,
+                       hoursum, statsmerge)
+
+# columns to import and types stored in raw cache
+RAW_TYPES = {'YR': 'uint16', 'MO': 'uint8', 'DY': 'uint8', 'HR': 'uint8',
+             'LAT': 'float64', 'LON': 'float64', 'W': 'float64',
+             'VV': 'float64', 'WW': 'float64', 'SLP': 'float64',
+             'AT': 'float64', 'WH': 'float64', 'PT': 'float64',
+             'ND': 'float64'}
+# rename of cols
+NAMES = {'YR': 'year', 'MO': 'month', 'DY': 'day', 'HR': 'hour',
+         'LAT': 'lat', 'LON': 'lon', 'W': 'wind speed', 'VV': 'vis',
+         'WW': 'pres weather', 'SLP': 'sea level pressure',
+         'AT': 'air temp', 'WH': 'wave height', 'ND': 'nightday'}
+# cols with nan percentage in review
+NANPERC_COLS = ['wind speed', 'vis', 'pres weather', 'sea level pressure',
+                'air temp', 'wave height']
+# cols summarised for each period (see icoadsagg)
+SUMMARY_COLS = ['wind speed',          # m/s
+                'wave height',         # m
+                'air temp',            # deg c
+                'vis',                 # see report
+                'sea level pressure']  # hPa
 
 
 def icoadsimp(param, bounds):
 
-    # file path
+    # filter each file and merge, flag, then ratio of operable time
+    ic_filt = icoadsmerge(param, bounds,
+                          [icoadsfilt(dict(param, icoadsfile=name), bounds)
+                           for name in icoadsfiles(param)])
+    ic_flags = icoadsflags(param, ic_filt)
+    ratio = icoadsratio(ic_flags)
+    return icoadsdict(ic_filt, ic_flags, ratio)
+
+
+def icoadsfiles(param):
+
+    # ICOADS CSV followed by monthly extracts appended to it, in date order
+    return [param['icoadsfile']] + list(param['icoadsappend'])
+
+
+def icoadskey(param):
+
+    # key of raw cache of CSV (see rawkey)
+    return rawkey(param['datafolder'] / param['icoadsfile'], RAW_TYPES)
+
+
+def icoadsraw(param):
+
+    # build columnar cache of CSV (see colcache) if not already built
+    # cache is keyed by CSV file (and types) so is shared by areas using the
+    # same file
     icoadsfile = param['datafolder'] / param['icoadsfile']
-    # columns to import
-    cols = ['YR', 'MO', 'DY', 'HR', 'LAT', 'LON', 'W', 'VV', 'WW', 'SLP',
-            'AT', 'WH', 'PT', 'ND']
-    # read CSV
-    data = pd.read_csv(icoadsfile, usecols=cols, dtype={'HR': np.int64})
+    raw_path = (param['datafolder'] / 'cache'
+                / ('icoadsraw_' + icoadskey(param)))
+    if cachemeta(raw_path) is not None:
+        return raw_path
+
+    # csv reader, hour read as int64 so every chunk has the same types
+    read_ic = lambda chunksize: pd.read_csv(
+        icoadsfile, usecols=list(RAW_TYPES), dtype={'HR': np.int64},
+        chunksize=chunksize)
+    if param['icchunk'] is None:
+        # import csv in one go
+        chunks = [read_ic(None)]
+    else:
+        # stream csv in chunks, memory is set by chunk size not file size
+        chunks = read_ic(param['icchunk'])
+
+    # length and nan count of each column before filtering (for review),
+    # accumulated as running totals
+    original = {'len': 0, 'nan': 0}
+    for chunkno, chunk in enumerate(chunks):
+        cachewrite(chunk, raw_path, chunkno, RAW_TYPES,
+                   chunk['YR']*100 + chunk['MO'])
+        original['len'] += len(chunk)
+        original['nan'] = chunk.isna().sum() + original['nan']
+
+    # save review with cache, completes cache
+    cacheclose(raw_path, {'original': original})
+    return raw_path
+
+
+def icoadsfilt(param, bounds):
+
+    # retrive columnar cache of CSV, filtered by bounds (pushed down so
+    # only entries within bounds are read)
+    raw_path = icoadsraw(param)
+    original = cachemeta(raw_path)['original']
+    data = cacheread(raw_path, columns=list(RAW_TYPES), bounds=bounds,
+                     loccols=('LAT', 'LON'))
+    # date parts as int64 (as read from CSV) so datetime parse can't overflow
+    data = data.astype({col: np.int64 for col in ['YR', 'MO', 'DY', 'HR']})
     # rename cols
-    data.rename(columns={'YR': 'year', 'MO': 'month', 'DY': 'day',
-                         'HR': 'hour', 'LAT': 'lat', 'LON': 'lon',
-                         'W': 'wind speed', 'VV': 'vis',
-                         'WW': 'pres weather',
-                         'SLP': 'sea level pressure', 'AT': 'air temp',
-                         'WH': 'wave height', 'ND': 'nightday'},
-                inplace=True)
-    # parse datetime
-    data['datetime'] = pd.to_datetime(data[['year', 'month', 'day', 'hour']],
-                                      infer_datetime_format=True)
-    data.drop(columns=['year', 'month', 'day', 'hour'], inplace=True)
+    data.rename(columns=NAMES, inplace=True)
     colorder = ['datetime', 'lat', 'lon', 'wind speed', 'vis', 'pres weather',
                 'sea level pressure', 'air temp', 'wave height', 'PT',
                 'nightday']
-    data = data.reindex(columns=colorder)
 
-    # review function
+    # review function, length and nan count so files can be merged
+    # (percentages found by icoadsmerge)
     review_list = []
-    flatten = lambda l: [item for sublist in l for item in sublist]
-    nanperc = lambda cols: ((data[cols].isna().sum() / len(data))*100)
-    nanperc_cols = ['wind speed', 'vis', 'pres weather', 'sea level pressure',
-                    'air temp', 'wave height']
-    review = lambda operation: review_list.append(flatten(
-        [[operation], [len(data)], nanperc(nanperc_cols).tolist()]))
-    review('Original')  # record orignal percentages
+    nancount = lambda cols: data[cols].isna().sum()
+    review = lambda operation: review_list.append(
+        [operation, len(data), nancount(NANPERC_COLS)])
+    # orignal totals saved with cache
+    review_list.append(['Original', original['len'],
+                        original['nan'].rename(index=NAMES)[NANPERC_COLS]])
 
     # begin filtering
-    # filter by lat lon
-    data.query('@bounds[2] < lat < @bounds[0] '
-               'and @bounds[3] < lon < @bounds[1]', inplace=True)
+    # filter by lat lon (done as read)
     review('Within Bounds')
-    # filter by date_range
+    # filter by date_range, months outside range dropped before datetime
+    # is parsed
     dt_range = param['icdaterange']
+    month = data['year']*100 + data['month']
+    data = data[(month <= dt_range[0].year*100 + dt_range[0].month)
+                & (month >= dt_range[1].year*100 + dt_range[1].month)]
+    # parse datetime
+    data = data.assign(datetime=pd.to_datetime(
+        data[['year', 'month', 'day', 'hour']], infer_datetime_format=True))
+    data = data.reindex(columns=colorder)
     data = (data[(data['datetime'] <= dt_range[0])
                  & (data['datetime'] >= dt_range[1])]
             .copy(deep=True))
     review('Limit Datetime Range')
     # take only moored bouys
-    nanperc_pt = {'all platform types': nanperc('PT')}  # % nans b4 drop
+    nancount_pt = {'all platform types': [len(data), nancount('PT')]}
     data.query('PT == 6', inplace=True)
-    nanperc_pt['moored bouys only'] = nanperc('PT')  # % nans after drop
+    nancount_pt['moored bouys only'] = [len(data), nancount('PT')]
     data.drop(columns='PT', inplace=True)    # drop PT col
     review('Moored bouys only')
 
-    # summary of data for hourly,monthly,daily,yearly,dataset
-    cols = ['datetime', 'wind speed', 'wave height', 'air temp', 'vis',
-            'sea level pressure', 'pres weather']  # cols to be analysed
-    funcs = ['mean', 'std', 'max', 'min', 'count']  # list of funcs to apply
-    # dict defining what functions to apply to each column
-    col_func = {'wind speed': funcs,                         # m/s
-                'wave height': funcs,                        # m
-                'air temp': funcs,                           # deg c
-                'vis': funcs,                                # see report
-                'sea level pressure': funcs,                 # hPa
-                'pres weather': [pd.Series.mode, 'count']}    # see report
-    # lambda to apply groupby summary functions
-    analysis = lambda freq: (data[cols].groupby(
-        pd.Grouper(key='datetime', freq=freq)).agg(col_func).reset_index())
-    # freq's to compute summary for
-    freq_dict = {'hour': 'H', 'day': 'D', 'week': 'W',
-                 'month': 'M', 'year': 'Y'}
-    # loop to iterate of freq_dict values and apply analysis lambda
-    summary = {}
-    for key, value in freq_dict.items():
-        summary[key] = analysis(value)
-    # special case for all values
-    col_func.pop('pres weather', None)
-    all_gen = data[cols].agg(col_func)  # run col_func except pres_weather
-    we_mode = data['pres weather'].mode()    # pres weather mode
-    we_count = data['pres weather'].count()  # pres weather count
-    # dataframe with correct col name for pres weather mode and count
-    all_we = pd.DataFrame([we_mode, pd.Series(we_count)],
-                          index=['mode', 'count'])
-    all_we.rename(columns={0: 'pres weather'}, inplace=True)
-    # concat to get final sumary for all data
-    summary['set'] = pd.concat([all_gen, all_we], axis=1)
-
-    # flags (based on average)
-    # create new dataframe with required variables
-    flags = data[['datetime', 'lat', 'lon', 'nightday']].copy(deep=True)
-    # create dictionary with conditions for flags
-    # present weather conditions
-    we_cond = [((data['pres weather'] >= 0)  # 1, good conditions
-                & (data['pres weather'] <= 4))
-               | (data['pres weather'] == 10)
-               | (data['pres weather'] == 11),
-               (data['pres weather'].isnull())]  # nan, not provided
-    # visability conditions
-    vis_cond = [(data['vis'] >= 92),
-                (data['vis'].isnull())]
-    # wind conditions
-    wind_cond = [(data['wind speed'] <= param['windlimit']),
-                 (data['wind speed'].isnull())]
-    cond_dict = {'weather': we_cond, 'vis': vis_cond, 'wind': wind_cond}
-    # determine flags
-    for key, value in cond_dict.items():
-        flags[key] = np.select(value, [True, np.nan], default=False)
-
-    # hourly flags: determine hourly flags, True only if ALL values true
-    fhour = (flags[['datetime', 'vis', 'wind', 'weather']]
-             .groupby(pd.Grouper(key='datetime', freq='H'))
-             .agg(['all', 'count'])
-             .reset_index())
-    # overall check flag using all values
-    fhour[('check', 'every')] = fhour[['vis', 'wind', 'weather']].all(axis=1)
-
-    # wind and vis based on hourly avg
-    hour_avg = ((summary['hour'][['wind speed', 'vis']])
-                .loc[:, (slice(None), ('mean'))]
-                .copy(deep=True))
-    hour_avg.columns = hour_avg.columns.droplevel(level=1)
-    # vis conditions
-    vis_cond = [(hour_avg['vis'] >= 92),
-                (hour_avg['vis'].isnull())]
-    # wind conditions
-    wind_cond = [(hour_avg['wind speed'] <= param['windlimit']),
-                 (hour_avg['wind speed'].isnull())]
-    cond_avg = {('vis', 'avg'): vis_cond, ('wind', 'avg'): wind_cond}
-    # loop over cond_avg setting bool value dependnt on conditions
-    for key, value in cond_avg.items():
-        fhour[key] = (np.select(value, [True, np.nan], default=False)
-                      .astype('bool'))
-    # overall check flag using avg vis and rain values
-    fhour[('check', 'avg')] = (pd.concat([
-        fhour.xs('avg', axis=1, level=1, drop_level=False),
-        fhour['weather']['all']], axis=1)  # retrive weather f
-                               .all(axis=1))
-    fhour.rename(columns={'all': 'flag'}, level=1, inplace=True)
-    # reorder
-    fhour = fhour.reindex(columns=['datetime', 'vis', 'wind',
-                                   'weather', 'check'], level=0)
-    # find differnce between respective means of check values
-    check_diff = (fhour[('check', 'avg')].mean() -
-                  fhour[('check', 'every')].mean())
+    # hourly statistics for summary (see icoadsmerge), None if no entries
+    stats = (hourstats(data, SUMMARY_COLS, 'pres weather') if len(data)
+             else None)
+    review = {'rows': original['len'],  # CSV rows to number rows of next
+              'filt nancount': review_list,
+              'platform type nancount': nancount_pt}
+    return {'data': data, 'stats': stats, 'review': review}
 
-    # flag ratio for time periods
-    # lambda to apply groupby summary functions
-    ratio_ana = lambda freq: (
-        fhour.groupby(pd.Grouper(key='datetime', freq=freq))
-        .mean()
-        .reset_index())
-    # freq's to compute summary for
-    freq_dict = {'hour': 'H', 'day': 'D', 'week': 'W',
-                 'month': 'M', 'year': 'Y'}
-    ratio = {}
-    # loop to iterate of freq_dict values and apply analysis lambda
-    for key, value in freq_dict.items():
-        ratio[key] = ratio_ana(value)
-    # special case for all values, mean of year values
-    ratio['set'] = ratio['year'].mean()
 
-    # organise data for output
+def icoadsmerge(param, bounds, ic_filts):
+
+    # merge filtered files (in icoadsfiles order) as if they were one CSV,
+    # rows numbered on from previous files and review totals added
+    rows, data = 0, []
+    for ic_filt in ic_filts:
+        data.append(ic_filt['data'].set_axis(
+            ic_filt['data'].index + rows, axis=0))
+        rows += ic_filt['review']['rows']
+    data = pd.concat(data)
+    review_list = []
+    for row in zip(*[ic_filt['review']['filt nancount']
+                     for ic_filt in ic_filts]):
+        length = sum(part[1] for part in row)
+        nancount = sum(part[2] for part in row)
+        review_list.append([row[0][0], length]
+                           + (nancount / length*100).tolist())
+    nanperc_pt = {}
+    for key in ['all platform types', 'moored bouys only']:
+        length, nancount = [sum(values) for values in zip(
+            *[ic_filt['review']['platform type nancount'][key]
+              for ic_filt in ic_filts])]
+        nanperc_pt[key] = nancount / length*100
+
+    # summary of data for hourly,daily,weekly,monthly,yearly,dataset
+    # hourly statistics of each file merged and rolled up to each (see
+    # icoadsagg), found from merged data if hours of files overlap
+    # mean, std, max, min, count of cols, mode and count of pres weather
+    stats = statsmerge([ic_filt['stats'] for ic_filt in ic_filts])
+    summary = aggsummary(data, SUMMARY_COLS, 'pres weather',
+                         stats)  # see report
+
     # create dataframe from review function
     review_cols = ['operation', 'len', 'wind speed', 'vis', 'pres weather',
                    'sea level pressure', 'air temp', 'wave height']
     nanperc_df = pd.DataFrame(review_list, columns=review_cols)
-    review = {'dt range': dt_range,  # datetime range
+    review = {'dt range': param['icdaterange'],  # datetime range
               'bouy loc': data[['lat', 'lon']].drop_duplicates(),
               'bounds': bounds,
               'platform type nanperc': nanperc_pt,  # nan% for plt ttpe
-              # difference between flag methods
-              'every avg diff': round(check_diff, 5),
               'filt nanperc': nanperc_df}  # review of filtering impact
-    results = {'summary': summary,
+    return {'data': data, 'summary': summary, 'review': review}
+
+
+def icoadsflags(param, ic_filt):
+
+    data = ic_filt['data']
+
+    # flags of each entry: 1 within limit (or good weather), 0 outside,
+    # nan not provided
+    values = {'weather': data['pres weather'].values,
+              'vis': data['vis'].values,
+              'wind': data['wind speed'].values}
+    with np.errstate(invalid='ignore'):
+        within = {'weather': np.isin(values['weather'],
+                                     param['goodweather']),
+                  'vis': values['vis'] >= param['vislimit'],
+                  'wind': values['wind'] <= param['windlimit']}
+    provided = {key: ~np.isnan(value) for key, value in values.items()}
+    # (added in place to a new frame of the columns kept, not copied again)
+    flags = data.reindex(columns=['datetime', 'lat', 'lon', 'nightday'])
+    for key in values:
+        flags[key] = np.where(provided[key], within[key], np.nan)
+
+    # hourly: number of values provided and within limit, found in one
+    # pass (see hoursum)
+    keys = ['vis', 'wind', 'weather']
+    hours, total = hoursum(
+        data['datetime'].values,
+        [provided[key] for key in keys] + [within[key] for key in keys])
+    count, inside = total[:, :3], total[:, 3:]
+    # avg: hourly mean (from hourly summary, as icoadssweep) within limit
+    # or no values
+    hour = ic_filt['summary']['hour']
+    mean = {'vis': hour[('vis', 'mean')].values,
+            'wind': hour[('wind speed', 'mean')].values}
+    with np.errstate(invalid='ignore'):
+        avg = {'vis': (np.isnan(mean['vis'])
+                       | (mean['vis'] >= param['vislimit'])),
+               'wind': (np.isnan(mean['wind'])
+                        | (mean['wind'] <= param['windlimit']))}
+    # hourly flags, flag True only if ALL values true
+    fhour = {('datetime', ''): hours}
+    for i, key in enumerate(keys):
+        fhour[(key, 'flag')] = inside[:, i] == count[:, i]
+        fhour[(key, 'count')] = count[:, i].astype(np.int64)
+        if key in avg:
+            fhour[(key, 'avg')] = avg[key]
+    # overall check flag using all values (at least one of each) and using
+    # avg vis and wind with all weather values
+    fhour[('check', 'every')] = np.logical_and.reduce(
+        [fhour[(key, 'flag')] & (count[:, i] > 0)
+         for i, key in enumerate(keys)])
+    fhour[('check', 'avg')] = (avg['vis'] & avg['wind']
+                               & fhour[('weather', 'flag')])
+    fhour = pd.DataFrame(fhour)
+    # find differnce between respective means of check values
+    check_diff = (fhour[('check', 'avg')].mean() -
+                  fhour[('check', 'every')].mean())
+
+    return {'flag': flags, 'hourly flags': fhour, 'check diff': check_diff}
+
+
+def icoadsratio(ic_flags):
+
+    fhour = ic_flags['hourly flags']
+
+    # flag ratio for time periods (hour, day, week, month, year)
+    ratio = aggratio(fhour)
+    # special case for all values, mean of year values
+    ratio['set'] = ratio['year'].mean()
+
+    return ratio
+
+
+def icoadssweep(ic_filt, windlimits, vislimits, weathers):
+
+    # ratio of operable time (as icoadsratio 'set') for every combination
+    # of wind and vis limits and good present weather codes (list of lists)
+    # flags for each limit found from hourly summary (max/min within limit
+    # if all values are) so flags are not recomputed for each combination
+    hour = ic_filt['summary']['hour']
+    wind, vis = hour['wind speed'], hour['vis']
+    hours = pd.DatetimeIndex(hour[('datetime', '')])
+    index = pd.MultiIndex.from_product(
+        [list(windlimits), list(vislimits),
+         [tuple(weather) for weather in weathers]],
+        names=['windlimit', 'vislimit', 'goodweather'])
+    windlimits = np.asarray(windlimits, dtype=np.float64)
+    vislimits = np.asarray(vislimits, dtype=np.float64)
+    # wind and vis flags (hours x limits) broadcast against limits
+    # every: at least one value and all values within limit
+    # avg: hourly mean within limit or no values (as icoadsflags)
+    every_wind = ((wind['count'].values[:, None] > 0)
+                  & (wind['max'].values[:, None] <= windlimits))
+    avg_wind = (wind['mean'].isna().values[:, None]
+                | (wind['mean'].values[:, None] <= windlimits))
+    every_vis = ((vis['count'].values[:, None] > 0)
+                 & (vis['min'].values[:, None] >= vislimits))
+    avg_vis = (vis['mean'].isna().values[:, None]
+               | (vis['mean'].values[:, None] >= vislimits))
+    # weather flags (hours x weathers), hour is good if it has no codes
+    # outside good codes, from histogram of codes in each hour
+    data = ic_filt['data']
+    idx = ((data['datetime'].values - hours.values[0])
+           // np.timedelta64(1, 'h')).astype(np.int64)
+    codes = data['pres weather'].values
+    valid = ~np.isnan(codes)
+    hist, labels = codehist(idx[valid], codes[valid], len(hours))
+    bad = hist @ np.column_stack([~np.isin(labels, weather)
+                                  for weather in weathers])
+    all_weather = bad == 0
+    every_weather = (hist.sum(axis=1)[:, None] > 0) & all_weather
+
+    # operable hours in each year for every combination, wind and vis
+    # combinations (hours x wind*vis) multiplied by weather for each year
+    # ratio as mean of years (as icoadsratio)
+    pair = lambda wind, vis: (wind[:, :, None] & vis[:, None, :]).reshape(
+        len(hours), -1).astype(np.float64)
+    checks = {'avg': (pair(avg_wind, avg_vis), all_weather),
+              'every': (pair(every_wind, every_vis), every_weather)}
+    start = bins(hours, 'Y')[1]
+    end = np.r_[start[1:], len(hours)]
+    ratio = {key: np.mean([left[a:b].T @ right[a:b] / (b - a)
+                           for a, b in zip(start, end)], axis=0).ravel()
+             for key, (left, right) in checks.items()}
+    return pd.DataFrame(ratio, index=index)
+
+
+def icoadsdict(ic_filt, ic_flags, ratio):
+
+    # organise data for output
+    review = dict(ic_filt['review'])
+    # difference between flag methods
+    review['every avg diff'] = round(ic_flags['check diff'], 5)
+    results = {'summary': ic_filt['summary'],
                'ratio': ratio}
-    alldata = {'filtered': data,
-               'flag': flags,
-               'hourly flags': fhour}
+    alldata = {'filtered': ic_filt['data'],
+               'flag': ic_flags['flag'],
+               'hourly flags': ic_flags['hourly flags']}
     icoads_dict = {'data': alldata,
                    'results': results,
                    'review': review}
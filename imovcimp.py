@@ -11,10 +11,24 @@ imports IMO Vessel Code list
 from csv found in data folder
 data from: https://github.com/warrantgroup/IMO-Vessel-Codes
 note: data last updated 03/03/16
+
+imovcindex keeps the cleaned list as arrays sorted by IMO (type and flag as
+codes) in a binary cache keyed by the csv file, so the csv is only read and
+cleaned again when it changes, imovcfind and imovclookup find arrays of IMO
+in it by binary search
 """
+import os
 import re
+
+import numpy as np
 import pandas as pd
 
+from stagecache import atomicwrite, rawkey
+
+# ship types, Ro-Ro and Bulk as replaced below
+TYPES = ['Container', 'Ro-Ro', 'Cargo', 'Tanker', 'Carrier', 'Reefer', 'Other',
+         'Bulk']
+
 
 def imovcimp(filename):
 
@@ -28,12 +42,70 @@ def imovcimp(filename):
     imovc['type'] = (imovc['type']
                      .str.replace('^.*Ro-Ro.*$', 'Ro-Ro')
                      .str.replace('^.*Bulk.*$', 'Bulker'))
-    reg = re.compile(r'(Container|Ro-Ro|Cargo|Tanker|Carrier|Reefer|Other'
-                     '|Bulk)')
-    imovc['type'] = imovc['type'].str.extract(reg)
+    reg = re.compile('(' + '|'.join(TYPES) + ')')
+    # type as categorical
+    imovc['type'] = (imovc['type'].str.extract(reg, expand=False)
+                     .astype(pd.CategoricalDtype(TYPES)))
     # Drop na types
     imovc = imovc[imovc['type'].notna()]
     # drop duplicates
     imovc = imovc.drop_duplicates(subset='IMO')
 
     return imovc
+
+
+def imovckey(param):
+
+    # key of sorted index of imo vessel codes (see rawkey), ship types are
+    # stored as codes so are part of key
+    return rawkey(param['datafolder'] / param['imovcfile'], {'type': TYPES})
+
+
+def imovcbuild(param):
+
+    # build sorted index of imo vessel codes from csv if not in cache,
+    # returns path of index
+    imovcfile = param['datafolder'] / param['imovcfile']
+    path = param['datafolder'] / 'cache' / ('imovc_' + imovckey(param)
+                                            + '.npz')
+    if not os.path.exists(path):
+        imovc = imovcimp(imovcfile).sort_values('IMO', kind='mergesort')
+        # flag as codes and categories (-1 missing)
+        flag, flags = pd.factorize(imovc['flag'])
+        # workers may build the index at once (see atomicwrite)
+        atomicwrite(path, lambda file: np.savez(
+            file, imo=imovc['IMO'].values.astype(np.int64),
+            type=imovc['type'].cat.codes.values.astype(np.int8),
+            flag=flag.astype(np.int32), flags=np.asarray(flags, dtype=str)))
+    return path
+
+
+def imovcindex(param):
+
+    # sorted index of imo vessel codes (see imovcbuild)
+    with np.load(imovcbuild(param)) as index:
+        return {key: index[key] for key in index.files}
+
+
+def imovcfind(index, imo):
+
+    # position in index of each imo, -1 if not in index
+    # only distinct imo are searched for (AIS entries repeat ships)
+    codes, uniq = pd.factorize(np.asarray(imo))
+    pos = np.searchsorted(index['imo'], uniq)
+    pos[pos == len(index['imo'])] = 0
+    pos = np.where(index['imo'][pos] == uniq, pos, -1)
+    # code -1 (missing imo) not found
+    return np.append(pos, -1)[codes]
+
+
+def imovclookup(index, imo):
+
+    # type and flag of each imo (NaN if not in index), found: True if in index
+    pos = imovcfind(index, imo)
+    found = pos >= 0
+    ship_type = pd.Categorical.from_codes(
+        np.where(found, index['type'][pos], -1), TYPES)
+    flag = np.where(found, index['flag'][pos], -1)
+    flag = np.append(index['flags'].astype(object), np.nan)[flag]
+    return found, ship_type, flag
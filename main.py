@@ -8,7 +8,11 @@ Created on May 2020
 @author: Callum Gilmour
 
 Main program for GTN planning and sales tool:
-    Estimates yearly test numbers for give area
+    Estimates yearly test numbers for give area (tool)
+    or for a list of areas in parallel (batch)
+    or for a grid of operational limits (sweep)
+    or as distribution from simulated years (simulate)
+    or for candidate sites, ranked (search)
     Plots graphs and maps analysis data
     (Plots and maps available for Humber Estuary Only)
 
@@ -16,55 +20,73 @@ User inputs should be predefined in paraimp script
 
 Folder Structure:
     All data files should be stored in 'data' folder, with file names edited
-    in paraimp
+    in paraimp, monthly extracts are added to 'aisappend' and 'icoadsappend'
+    so only the new files are imported (stages of each file are cached)
+    Results of each stage are cached in 'data/cache' (see stagecache)
     All plots are export to the 'plots' folder
 """
 # python libraries
-import os
-import pickle as pkl
+import time
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
 # program moudles
 from paramimp import paramimp
 from bounds import bounds
-from aisimp import aisimp
-from icoadsimp import icoadsimp
+from aisimp import (aisfiles, aiskey, aisgrid, aisscrub, aismerge,
+                    aisimo)
+from imovcimp import imovckey, imovcbuild
+from icoadsimp import (icoadsfiles, icoadskey, icoadsraw, icoadsfilt,
+                       icoadsmerge, icoadsflags, icoadsratio, icoadssweep,
+                       icoadsdict)
+from stagecache import stagekey, stage
+from montecarlo import montecarlo
+from shipweather import shipweather
+from sites import ORIENS, sitegrid, sites
+from visits import aisvisits
 from plots import plots
 from pltmaps import pltmaps
 
+# parameters used by each stage, a stage (and those after it) is rerun when
+# any of these change (see stagecache)
+STAGE_PARAM = {'aisscrub': ['ignore', 'targetport', 'qualifiers', 'abrv',
+                            'are dest', 'extract'],
+               'aisimo': ['ports', 'months'],
+               'aisvisits': ['visitgap', 'callspeed', 'calltime'],
+               'icoadsfilt': ['icdaterange'],
+               'icoadsmerge': ['icdaterange'],
+               'icoadsflags': ['windlimit', 'vislimit', 'goodweather'],
+               'icoadsratio': []}
 
-def tool(area):  # humber,southampton,wales
+
+def tool(area, parallel=True):  # humber,southampton,wales
 
     # Import Parameters
     param = paramimp(area)
 
-    # AIS:retrive or scrub and analyse AIS data
-    # Define ais bounds
-    ais_bounds = bounds(param, param['boundsize'])
-    # define path of pickle
-    ais_path = param['datafolder'] / (param['area'] + '_ais_dict.pkl')
-    # check if pickle of analysed data exsits in data directory
-    if os.path.exists(ais_path):
-        with open(ais_path, 'rb') as file:
-            ais_dict = pkl.load(file)
-    else:
-        ais_dict = aisimp(param, ais_bounds)
-        # save pickle of analysed data to file
-        with open(ais_path, 'wb') as file:
-            pkl.dump(ais_dict, file)
+    # Define ais and weather bounds
+    ais_bounds, weather_bounds = areabounds(param)
 
-    # Weather: retrive or, scrub and analyse ICOADS
-    # Define weather bounds
-    weather_bounds = bounds(param, ((param['boundsize'][0])*2,
-                                    (param['boundsize'][1])))
-    ic_path = param['datafolder'] / (param['area'] + '_icoads_dict.pkl')
-    # check if pickle exists
-    if os.path.exists(ic_path):
-        with open(ic_path, 'rb') as file:
-            icoads_dict = pkl.load(file)
+    # pools left at default (None) are not started inside a worker process
+    # (AIS branch if parallel, all of tool if not as batch is parallel)
+    nested = {key: 1 for key in ['yearworkers', 'plotworkers']
+              if param[key] is None}
+    if not parallel:
+        param = dict(param, **nested)
+
+    # AIS and weather are independent until results so are run at the same
+    # time in two processes (or one after the other if not parallel)
+    branches = [(aisbranch, dict(param, **nested), ais_bounds),
+                (icoadsbranch, param, weather_bounds)]
+    if parallel:
+        with ProcessPoolExecutor(max_workers=2) as pool:
+            futures = [pool.submit(timed, *branch) for branch in branches]
+            ((ais_dict, ais_time),
+             (icoads_dict, icoads_time)) = [future.result()
+                                            for future in futures]
     else:
-        icoads_dict = icoadsimp(param, weather_bounds)
-        # save pickle to file of analysed data
-        with open(ic_path, 'wb') as file:
-            pkl.dump(icoads_dict, file)
+        ((ais_dict, ais_time),
+         (icoads_dict, icoads_time)) = [timed(*branch)
+                                        for branch in branches]
 
     # results
     # calculate operational ratio based on weather and maintance
@@ -74,6 +96,35 @@ def tool(area):  # humber,southampton,wales
         ('check', 'avg')]
     op_ratio_we['every'] = icoads_dict['results']['ratio']['set'][
         ('check', 'every')]
+    # ships per year (mean of years if AIS covers more than one)
+    year_ships = yearships(ais_dict)
+    op_range, ships_tested, ships_tested_imovcadj = shipstested(
+        param, year_ships.mean(), imovcmulti(ais_dict), op_ratio_we)
+    # creat dictionary to return
+    test_numbers = {
+        'normal': ships_tested, 'imovc adj': ships_tested_imovcadj,
+        'ratio': {'avg': op_range['avg'], 'all': op_range['every']},
+        'year ships': year_ships.to_dict(),
+        # ships arriving while system could operate (see shipweather)
+        'joint': shipweather(ais_dict['data'],
+                             icoads_dict['data']['hourly flags'])['tested'],
+        'time': {'ais': ais_time, 'icoads': icoads_time}}  # wall-clock (s)
+
+# Plot graphs and maps
+    if area == 'humber':
+        # Graphs
+        plots(ais_dict, icoads_dict, param, test_numbers)
+        # Plot Map
+        pltmaps(ais_bounds, weather_bounds, param,
+                icoads_dict['review']['bouy loc'])
+
+    return ais_dict, icoads_dict, test_numbers
+
+
+def shipstested(param, ships, imovc_multi, op_ratio_we):
+
+    # number of ships tested from number of ships (in bounds) and
+    # operational ratio (from weather)
     op_range = {}
     op_range['avg'] = (
         op_ratio_we['avg'],  # 100% crossover
@@ -84,30 +135,216 @@ def tool(area):  # humber,southampton,wales
 
     # Calculate number of ships tested
     ships_tested = [
-        len(ais_dict['ships'])*op_range['avg'][0],
-        len(ais_dict['ships'])*op_range['avg'][1],
-        len(ais_dict['ships'])*op_range['every'][0],
-        len(ais_dict['ships'])*op_range['every'][1]]
+        ships*op_range['avg'][0],
+        ships*op_range['avg'][1],
+        ships*op_range['every'][0],
+        ships*op_range['every'][1]]
     ships_tested = [int(num) for num in ships_tested]
     ships_tested = [max(ships_tested), min(ships_tested)]  # max and min
+    # apply multiplier for vessels not found in IMO Vessel code list
+    ships_tested_imovcadj = [int(num*imovc_multi) for num in ships_tested]
+    return op_range, ships_tested, ships_tested_imovcadj
+
+
+def yearships(ais_dict):
+
+    # number of ships (in bounds) in each year of AIS, ships counted in
+    # each year so a ship seen in several years is counted in each
+    data = ais_dict['data']
+    return data.groupby(data['date'].dt.year.rename('year'))['IMO'].nunique()
+
+
+def imovcmulti(ais_dict):
+
     # number of vessels not found in IMO Vessel code list to estimate error
     imovc_pre = ais_dict['review']['filtering'].iloc[8, 2]
-    imovc_multi = (
-        1 + (imovc_pre - ais_dict['review']['filtering'].iloc[9, 2])
-        / imovc_pre)  # calculate multiplier
-    # apply multiplier
-    ships_tested_imovcadj = [int(num*imovc_multi) for num in ships_tested]
-    # creat dictionary to return
-    test_numbers = {
-        'normal': ships_tested, 'imovc adj': ships_tested_imovcadj,
-        'ratio': {'avg': op_range['avg'], 'all': op_range['every']}}
+    return (1 + (imovc_pre - ais_dict['review']['filtering'].iloc[9, 2])
+            / imovc_pre)  # calculate multiplier
 
-# Plot graphs and maps
-    if area == 'humber':
-        # Graphs
-        plots(ais_dict, icoads_dict, param, test_numbers)
-        # Plot Map
-        pltmaps(ais_bounds, weather_bounds, param,
-                icoads_dict['review']['bouy loc'])
 
-    return ais_dict, icoads_dict, test_numbers
+def simulate(area, years=10**5, workers=None, seed=0):
+
+    # Monte Carlo distribution of yearly test numbers (see montecarlo)
+    # AIS and ICOADS stages retrived from cache or run
+    param = paramimp(area)
+    ais_bounds, weather_bounds = areabounds(param)
+    ais_dict = aisbranch(param, ais_bounds)
+    icoads_dict = icoadsbranch(param, weather_bounds)
+    return montecarlo(param, ais_dict, icoads_dict, imovcmulti(ais_dict),
+                      years=years, workers=workers, seed=seed)
+
+
+def sweep(area, windlimits=None, vislimits=None, weathers=None):
+
+    # test numbers for every combination of operational limits, wind and
+    # vis limits and lists of good present weather codes (defaults from
+    # param), returns dataframe with row for each combination
+    param = paramimp(area)
+    windlimits = [param['windlimit']] if windlimits is None else windlimits
+    vislimits = [param['vislimit']] if vislimits is None else vislimits
+    weathers = [param['goodweather']] if weathers is None else weathers
+    ais_bounds, weather_bounds = areabounds(param)
+    # AIS and filtered ICOADS retrived from cache or run, then ratio for
+    # every combination at once (see icoadssweep)
+    ais_dict = aisbranch(param, ais_bounds)
+    ratio = icoadssweep(filtstage(param, weather_bounds)[1],
+                        windlimits, vislimits, weathers)
+    rows = []
+    for op_ratio_we in ratio.to_dict('records'):
+        op_range, ships_tested, ships_tested_imovcadj = shipstested(
+            param, yearships(ais_dict).mean(), imovcmulti(ais_dict),
+            op_ratio_we)
+        rows.append(ships_tested + ships_tested_imovcadj
+                    + list(op_range['avg']) + list(op_range['every']))
+    columns = pd.MultiIndex.from_product(
+        [['normal', 'imovc adj'], ['max', 'min']]).append(
+        pd.MultiIndex.from_product([['ratio avg', 'ratio all'],
+                                    ['min', 'max']]))
+    return pd.DataFrame(rows, index=ratio.index, columns=columns)
+
+
+def search(area, centres=None, oriens=None, sizes=None, workers=None):
+
+    # rank candidate sites, every combination of centres (lat, lon),
+    # orientations and bounds sizes (out, along) NM (defaults: ports of
+    # area, all orientations, boundsize), by number of ships tested
+    param = paramimp(area)
+    if centres is None:
+        centres = list(dict.fromkeys([param['portlatlon']]
+                                     + list(param['port_loc'].values())))
+    oriens = ORIENS if oriens is None else oriens
+    sizes = [param['boundsize']] if sizes is None else sizes
+    candidates = sitegrid(param, centres, oriens, sizes)
+    # AIS scrubbed once for box covering every candidate, ships in each
+    # candidate counted from its entries (see sites)
+    cover = [float(candidates['N'].max()), float(candidates['E'].max()),
+             float(candidates['S'].min()), float(candidates['W'].min())]
+    ais_dict = aisbranch(param, cover)
+    candidates = sites(ais_dict['data'], candidates, workers)
+    # weather ratio of area for every candidate (few bouys in each area)
+    ratio = icoadsbranch(param, areabounds(param)[1])['results']['ratio'][
+        'set']
+    op_ratio_we = {'avg': ratio[('check', 'avg')],
+                   'every': ratio[('check', 'every')]}
+    tested = [shipstested(param, ships, imovcmulti(ais_dict), op_ratio_we)
+              for ships in candidates['ships']]
+    for i, key in enumerate(['normal max', 'normal min']):
+        candidates[key] = [numbers[1][i] for numbers in tested]
+    for i, key in enumerate(['imovc adj max', 'imovc adj min']):
+        candidates[key] = [numbers[2][i] for numbers in tested]
+    return (candidates.sort_values(['normal max', 'normal min'],
+                                   ascending=False, kind='mergesort')
+            .reset_index(drop=True))
+
+
+def batch(areas, workers=None):
+
+    # run tool for list of areas in a pool of worker processes (default one
+    # per cpu), returns dictionary of test_numbers for each area
+    params = [paramimp(area) for area in areas]
+    # one param for each distinct input file
+    ais_files = {param['datafolder'] / name: dict(param, aisfile=name)
+                 for param in params for name in aisfiles(param)}
+    ic_files = {param['datafolder'] / name: dict(param, icoadsfile=name)
+                for param in params for name in icoadsfiles(param)}
+    imovc_files = {param['datafolder'] / param['imovcfile']: param
+                   for param in params}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # build raw caches (and AIS spatial index, IMO index) first, so a
+        # file used by more than one area is only parsed once
+        raw = ([pool.submit(aisgrid, param) for param in ais_files.values()]
+               + [pool.submit(icoadsraw, param)
+                  for param in ic_files.values()]
+               + [pool.submit(imovcbuild, param)
+                  for param in imovc_files.values()])
+        for future in raw:
+            future.result()
+        test_numbers = list(pool.map(batchtool, areas))
+
+    return dict(zip(areas, test_numbers))
+
+
+def batchtool(area):
+
+    # tool for use by batch, only test numbers returned to main process
+    # AIS and weather run one after the other as batch is already parallel
+    return tool(area, parallel=False)[2]
+
+
+def areabounds(param):
+
+    # Define ais bounds
+    ais_bounds = bounds(param, param['boundsize'])
+    # Define weather bounds
+    weather_bounds = bounds(param, ((param['boundsize'][0])*2,
+                                    (param['boundsize'][1])))
+    return ais_bounds, weather_bounds
+
+
+def timed(func, *args):
+
+    # run func, returns result and wall-clock time (s)
+    start = time.perf_counter()
+    return func(*args), time.perf_counter() - start
+
+
+def aisbranch(param, ais_bounds):
+
+    # AIS:retrive or scrub and analyse AIS data
+    # keys of each stage, from parameters, raw cache keys of files and
+    # upstream stage keys
+    # AIS scrubbed for each file (see aisfiles) so a new monthly file is
+    # the only one scrubbed
+    params = [dict(param, aisfile=name) for name in aisfiles(param)]
+    scrub_keys = [stagekey(file_param, 'aisscrub', STAGE_PARAM['aisscrub'],
+                           deps=[aiskey(file_param), ais_bounds])
+                  for file_param in params]
+    imo_key = stagekey(param, 'aisimo', STAGE_PARAM['aisimo'],
+                       deps=[imovckey(param)] + scrub_keys)
+    visits_key = stagekey(param, 'aisvisits', STAGE_PARAM['aisvisits'],
+                          deps=[imo_key])
+    # retrive stage from cache or run it (upstream stages retrived or run
+    # only if needed)
+    ais_scrub = lambda: aismerge(param, [
+        stage(file_param, 'aisscrub', scrub_key,
+              lambda: aisscrub(file_param, ais_bounds))
+        for file_param, scrub_key in zip(params, scrub_keys)])
+    ais_dict = stage(param, 'aisimo', imo_key,
+                     lambda: aisimo(param, ais_scrub()))
+    # visits (port calls and transits) of each ship, see visits
+    visits = stage(param, 'aisvisits', visits_key,
+                   lambda: aisvisits(param, ais_dict['data']))
+    return dict(ais_dict, visits=visits)
+
+
+def icoadsbranch(param, weather_bounds):
+
+    # Weather: retrive or, scrub and analyse ICOADS
+    filt_key, ic_filt = filtstage(param, weather_bounds)
+    flags_key = stagekey(param, 'icoadsflags', STAGE_PARAM['icoadsflags'],
+                         deps=[filt_key])
+    ratio_key = stagekey(param, 'icoadsratio', STAGE_PARAM['icoadsratio'],
+                         deps=[flags_key])
+    ic_flags = stage(param, 'icoadsflags', flags_key,
+                     lambda: icoadsflags(param, ic_filt))
+    ratio = stage(param, 'icoadsratio', ratio_key,
+                  lambda: icoadsratio(ic_flags))
+    return icoadsdict(ic_filt, ic_flags, ratio)
+
+
+def filtstage(param, weather_bounds):
+
+    # ICOADS import and filter stage for each file (see icoadsfiles) then
+    # merge stage, returns key and result of merge
+    params = [dict(param, icoadsfile=name) for name in icoadsfiles(param)]
+    filt_keys = [stagekey(file_param, 'icoadsfilt',
+                          STAGE_PARAM['icoadsfilt'],
+                          deps=[icoadskey(file_param), weather_bounds])
+                 for file_param in params]
+    merge_key = stagekey(param, 'icoadsmerge', STAGE_PARAM['icoadsmerge'],
+                         deps=filt_keys)
+    return merge_key, stage(param, 'icoadsmerge', merge_key, lambda: (
+        icoadsmerge(param, weather_bounds, [
+            stage(file_param, 'icoadsfilt', filt_key,
+                  lambda: icoadsfilt(file_param, weather_bounds))
+            for file_param, filt_key in zip(params, filt_keys)])))
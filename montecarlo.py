@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+montecarlo
+
+GTN Planning Tool
+Created on May 2020
+@author: Callum Gilmour
+
+Monte Carlo estimate of yearly test numbers
+Each simulated year is built day by day:
+    ship arrivals: daily count of first sightings in the year (from AIS),
+    resampled from days of the same month
+    weather: hourly check flags (from ICOADS), whole days resampled from
+    days of the same month so hours of a day stay together
+    maintenance: each day lost with probability non_op_maint
+A ship is tested if it arrives in an operable hour (hour of arrival drawn
+from time of day trends) on a day without maintenance
+Years are simulated in batches of arrays, batches can be run in parallel,
+each batch has its own seed (from SeedSequence) so results do not depend on
+number of workers
+"""
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+# days in each month of simulated year, check flags simulated
+from aisimp import MONTH_DAYS
+from shipweather import CHECKS
+
+
+def mcinputs(param, ais_dict, icoads_dict):
+
+    # arrays needed to simulate a year, taken from analysed data
+    # arrivals: number of ships first seen in the year on each AIS day
+    # (ships seen in earlier years arrive again)
+    data = ais_dict['data']
+    first = data.groupby(['IMO', data['date'].dt.year.rename('year')])[
+        'date'].min()
+    first = first.dt.tz_localize(None).dt.normalize()
+    days = pd.date_range(first.min(), first.max(), freq='D')
+    arrivals = first.value_counts().reindex(days, fill_value=0)
+    # probability of arrival in each hour (adjusted time of day trend)
+    hour_ships = (ais_dict['review']['uship']['hour_ships']['count adj']
+                  .reindex(range(24), fill_value=0))
+    hour_prob = (hour_ships / hour_ships.sum()).values
+    # weather: chance arrival is in operable hour for each complete ICOADS
+    # day, for each check
+    fhour = icoads_dict['data']['hourly flags']
+    check = pd.DataFrame({key: fhour[('check', key)].values
+                          for key in CHECKS},
+                         index=pd.DatetimeIndex(fhour[('datetime', '')]))
+    day = check.index.normalize()
+    complete = pd.Series(day).map(pd.Series(day).value_counts()).values == 24
+    check = check[complete]
+    ok = check.values.reshape(-1, 24, len(CHECKS))
+    weather = np.einsum('dhc,h->dc', ok.astype(np.float64), hour_prob)
+    # days of each month as pools to resample from, (start, size) of
+    # each month in month sorted day arrays
+    pools = lambda months: (np.argsort(months, kind='stable'),
+                            np.bincount(months - 1, minlength=12))
+    arrival_order, arrival_size = pools(arrivals.index.month.values)
+    weather_order, weather_size = pools(
+        check.index[::24].month.values)
+    if not (arrival_size.all() and weather_size.all()):
+        raise ValueError('AIS and ICOADS data must include every month')
+    return {'arrivals': arrivals.values[arrival_order],
+            'arrival size': arrival_size,
+            'weather': weather[weather_order],
+            'weather size': weather_size,
+            'maint': param['non_op_maint']}
+
+
+def mcyears(inputs, years, seed):
+
+    # ships tested in each of years simulated years (years x checks)
+    rng = np.random.default_rng(seed)
+    month = np.repeat(np.arange(12), MONTH_DAYS)
+    # random day from same month of each pool for every simulated day
+    pick = lambda size: (
+        (np.cumsum(size) - size)[month]
+        + (rng.random((years, len(month))) * size[month]).astype(np.int64))
+    arrivals = inputs['arrivals'][pick(inputs['arrival size'])]
+    weather = inputs['weather'][pick(inputs['weather size'])]
+    maint = rng.random((years, len(month))) < inputs['maint']
+    # each arrival tested with chance of operable hour on its day (none on
+    # maintenance days), one draw per arrival (arrivals are few per day so
+    # quicker than binomial draw per day)
+    chance = (weather * ~maint[:, :, None]).reshape(-1, len(CHECKS))
+    day = np.repeat(np.arange(years*len(month)), arrivals.ravel())
+    tested = rng.random(len(day))[:, None] < chance[day]
+    year = day // len(month)
+    return np.column_stack([np.bincount(year, weights=tested[:, i],
+                                        minlength=years)
+                            for i in range(len(CHECKS))]).astype(np.int64)
+
+
+def montecarlo(param, ais_dict, icoads_dict, imovc_multi, years=10**5,
+               batch=2000, workers=None, seed=0, ci=0.95):
+
+    # distribution of yearly ships tested from years simulated years
+    # run in batches of batch years in a pool of workers (None: one per
+    # cpu, 1: no pool), returns samples and summary (mean, std, interval)
+    inputs = mcinputs(param, ais_dict, icoads_dict)
+    sizes = [batch]*(years // batch) + ([years % batch] if years % batch
+                                        else [])
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    args = [[inputs]*len(sizes), sizes, seeds]
+    if workers == 1:
+        tested = list(map(mcyears, *args))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            tested = list(pool.map(mcyears, *args))
+    tested = np.concatenate(tested)
+    # samples of ships tested, and adjusted for ships not in IMO Vessel
+    # Code list
+    samples = pd.concat({'normal': pd.DataFrame(tested, columns=CHECKS),
+                         'imovc adj': pd.DataFrame(
+                             (tested*imovc_multi).astype(np.int64),
+                             columns=CHECKS)}, axis=1)
+    tails = [(1 - ci)/2, 0.5, (1 + ci)/2]
+    summary = pd.concat([samples.agg(['mean', 'std']),
+                         samples.quantile(tails)])
+    summary.index = ['mean', 'std'] + ['%g%%' % (tail*100)
+                                       for tail in tails]
+    return {'samples': samples, 'summary': summary}
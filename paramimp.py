@@ -22,15 +22,45 @@ def paramimp(area):
         'non_op_maint': 1/7,  # non operational days due to maintance
                               # (1 day out of 7)
         'windlimit': 15,  # m/s (UAV or sensor whichever is lower)
+        'vislimit': 92,  # min ICOADS vis code (see report)
+        # ICOADS present weather codes of good conditions (see report)
+        'goodweather': [0, 1, 2, 3, 4, 10, 11],
         'boundsize': (30, 80),  # (out,along coast with port at middle) NM
         # data range to use for ICOADS data
-        'icdaterange': [ts(2019, 12, 31, 23, 59), ts(2018, 1, 1)]}
+        'icdaterange': [ts(2019, 12, 31, 23, 59), ts(2018, 1, 1)],
+        # rows per chunk when streaming AIS csv (None reads whole file)
+        'aischunk': 10**6,
+        # rows per chunk when streaming ICOADS csv (None reads whole file)
+        'icchunk': 10**6,
+        # size of spatial index grid cells for AIS (degrees)
+        'gridcell': 0.05,
+        # gap between positions which starts new visit (hours)
+        'visitgap': 6,
+        # visit is port call if stopped (below callspeed knots) for at least
+        # calltime hours
+        'callspeed': 0.5, 'calltime': 1,
+        # max number of dest kept in normalisation cache (see destnorm)
+        'destcachesize': 10**5,
+        # worker processes for yearly AIS tables (None: one per cpu, 1: no
+        # pool), only used if AIS covers more than one year, None is no pool
+        # when already in a worker (see tool)
+        'yearworkers': None,
+        # plot export (see plotexport), formats and scale of all figures,
+        # set for single figures by name in plotfigs
+        # (e.g. {'AIS_Time of Day Trends': {'formats': ['svg']}})
+        'plotformats': ['png', 'html'], 'plotscale': 6, 'plotfigs': {},
+        # worker processes for plot export (None: one per cpu, 1: no pool,
+        # None is no pool when already in a worker)
+        'plotworkers': None}
 
     files = {'datafolder': Path('data/'),
              'plotsfolder': Path('plots/'),
              'aisfile': area + '.csv',
              'imovcfile': 'imovc.csv',
-             'icoadsfile': area + '_icoads.csv'}
+             'icoadsfile': area + '_icoads.csv',
+             # monthly extracts appended to files above (in date order)
+             'aisappend': [],
+             'icoadsappend': []}
     # regex for work ships and similar to ignore
     reg = {'ignore': r'(?i)TOW|TUG|PILOT|DREDGE|DRYDOCK|ANC|DOCK|PS|'
                      r'OFFSHORE|DRIFT|\?{2,}'}
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+plotexport
+
+GTN Planning Tool
+Created on May 2020
+@author: Callum Gilmour
+
+Exports figures (see plots) to the plots folder, figures are written in a
+pool of worker processes (param['plotworkers']) as image export is slow
+Each figure is keyed by a hash of its data and layout (figure JSON), formats
+and scale, keys of exported figures are kept in plotsfolder/plotkeys.pkl so
+figures unchanged since they were last exported are skipped
+Formats ('png', 'html', 'svg', 'pdf', ...) and scale (of images) are set for
+all figures by param['plotformats'] and param['plotscale'], and for single
+figures by name in param['plotfigs'] (e.g. {name: {'scale': 2}})
+"""
+import os
+import hashlib
+import pickle as pkl
+from concurrent.futures import ProcessPoolExecutor
+
+import plotly.io as pio
+
+from stagecache import atomicwrite
+
+
+def plotwrite(folder, name, fig_json, formats, scale):
+
+    # write figure in each format, figure as JSON so it can be sent to a
+    # worker
+    fig = pio.from_json(fig_json)
+    for fmt in formats:
+        path = str(folder / (name + '.' + fmt))
+        if fmt == 'html':
+            fig.write_html(path)
+        else:
+            fig.write_image(path, scale=scale)
+    return name
+
+
+def plotexport(param, figs):
+
+    # export figures changed since last export, returns names written
+    folder = param['plotsfolder']
+    keys_path = folder / 'plotkeys.pkl'
+    old_keys = {}
+    if os.path.exists(keys_path):
+        with open(keys_path, 'rb') as file:
+            old_keys = pkl.load(file)
+    keys, jobs = {}, []
+    for name, fig in figs.items():
+        setting = dict({'formats': param['plotformats'],
+                        'scale': param['plotscale']},
+                       **param['plotfigs'].get(name, {}))
+        formats, scale = list(setting['formats']), setting['scale']
+        fig_json = fig.to_json()
+        keys[name] = hashlib.sha1(repr([fig_json, formats, scale])
+                                  .encode()).hexdigest()[:16]
+        # skip if unchanged and every file still there
+        if keys[name] == old_keys.get(name) and all(
+                os.path.exists(folder / (name + '.' + fmt))
+                for fmt in formats):
+            continue
+        jobs.append([folder, name, fig_json, formats, scale])
+
+    os.makedirs(folder, exist_ok=True)
+    if len(jobs) > 1 and param['plotworkers'] != 1:
+        with ProcessPoolExecutor(max_workers=param['plotworkers']) as pool:
+            written = list(pool.map(plotwrite, *zip(*jobs)))
+    else:
+        written = [plotwrite(*job) for job in jobs]
+    # keys saved once all figures are written (see atomicwrite)
+    atomicwrite(keys_path, lambda file: pkl.dump(dict(old_keys, **keys),
+                                                 file))
+    return written
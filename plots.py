@@ -19,6 +19,8 @@ import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 import pandas as pd
 
+from plotexport import plotexport
+
 
 def plots(ais_dict, icoads_dict, param, test_numbers):
 
@@ -64,49 +66,60 @@ def plots(ais_dict, icoads_dict, param, test_numbers):
         yaxis_title='Operation')
 
     # Ship distrubution over time
+    # uship tables are indexed by year then month (and 'sum' of each year)
+    # months labelled 'Mon YYYY' and total of every year
+    label = lambda index: [month+' '+str(year) for year, month in index]
+    total = lambda table, abrv: str(int(table.xs('sum', level=1)[abrv].sum()))
+    years = ais_dict['review']['uship']['year_uship'].index.levels[0]
+    years = (str(years[0]) if len(years) == 1
+             else str(years[0])+'-'+str(years[-1]))
     # Ships per month at each port as stacked bar (Unique to year)
     year_uship = ais_dict['review']['uship']['year_uship']
+    year_month = year_uship.drop('sum', level=1)
     bar = lambda name, abrv, color: go.Bar(
-        name=name+': '+str(int(year_uship.loc['sum', abrv])),
-        x=param['months'], y=year_uship[abrv],
+        name=name+': '+total(year_uship, abrv),
+        x=label(year_month.index), y=year_month[abrv],
         marker_color=color)
     # plot and adjust layout
-    name_gri = 'Grimby'+': '+str(int(year_uship.loc['sum', 'GRI']))
+    name_gri = 'Grimby'+': '+total(year_uship, 'GRI')
     fig4 = go.Figure(data=[
         bar('Immingham', 'IMM', lb), bar('Hull', 'HUL', yl),
         bar('Goole', 'GOO', tl), go.Bar(name=name_gri,
-                                        x=param['months'], y=year_uship['GRI'],
+                                        x=label(year_month.index),
+                                        y=year_month['GRI'],
                                         marker_color=pl,
-                                        text=year_uship['Perc'])])
+                                        text=year_month['Perc'])])
     fig4.update_layout(
         barmode='stack',
         title='Unique Ships by Month and Port (Year)',
         yaxis_title='Number of Unique Ships',
         xaxis_title='Months',
-        legend_title_text='Port: Total Ships (2019)')
+        legend_title_text='Port: Total Ships ('+years+')')
     fig4.update_traces(selector={'name': name_gri},
                        texttemplate='%{text}%',
                        textposition='outside')  # add monthly percentages
 
     # unique ships per month (unique to month)
     month_uship = ais_dict['review']['uship']['month_uship']
+    month_month = month_uship.drop('sum', level=1)
     bar = lambda name, abrv, color: go.Bar(
-        name=name+': '+str(int(month_uship.loc['sum', abrv])),
-        x=param['months'], y=month_uship[abrv],
+        name=name+': '+total(month_uship, abrv),
+        x=label(month_month.index), y=month_month[abrv],
         marker_color=color)
     # plot and adjust layout
-    name_gri = 'Grimby'+': '+str(int(month_uship.loc['sum', 'GRI']))
+    name_gri = 'Grimby'+': '+total(month_uship, 'GRI')
     fig5 = go.Figure(data=[
         bar('Immingham', 'IMM', lb), bar('Hull', 'HUL', yl),
         bar('Goole', 'GOO', tl), go.Bar(
-            name=name_gri, x=param['months'], y=month_uship['GRI'],
-            marker_color=pl, text=month_uship['Perc'])])
+            name=name_gri, x=label(month_month.index),
+            y=month_month['GRI'],
+            marker_color=pl, text=month_month['Perc'])])
     fig5.update_layout(
         barmode='stack',
         title='Unique Ships by Month and Port (Month)',
         yaxis_title='Number of Unique Ships',
         xaxis_title='Months',
-        legend_title_text='Port: Total Ships (2019)')
+        legend_title_text='Port: Total Ships ('+years+')')
     fig5.update_traces(selector={'name': name_gri},
                        texttemplate='%{text}%',
                        textposition='outside')  # add monthly percentages
@@ -117,20 +130,24 @@ def plots(ais_dict, icoads_dict, param, test_numbers):
                                 y=hour_ships['count adj'], marker_color=tl))
     fig6.update_layout(
         title='Time of Day Trends',
-        yaxis_title='Total Number Ships over Year',
+        yaxis_title='Total Number Ships ('+years+')',
         xaxis_title='Time of Day')
 
     # Total number of entries for each month: filtered
-    ais_month = ((ais_dict['data'][['date', 'IMO']])
-                 .groupby(pd.Grouper(key='date', freq='M'))
-                 .count())
-    ais_month.index = param['months']
-    ais_month.rename(columns={'IMO': 'filtered'}, inplace=True)
-    ais_month['all'] = ais_dict['review']['entries']
+    # (indexed by year and month as entries, months without entries 0)
+    dates = ais_dict['data']['date']
+    ais_month = ais_dict['review']['entries'].rename(
+        columns={'Entries': 'all'})
+    filtered = dates.groupby([dates.dt.year, dates.dt.month]).count()
+    filtered.index = pd.MultiIndex.from_tuples(
+        [(year, param['months'][month - 1])
+         for year, month in filtered.index])
+    ais_month['filtered'] = filtered.reindex(ais_month.index, fill_value=0)
+    ais_month.index = label(ais_month.index)
     fig7 = make_subplots(rows=1, cols=2)
-    fig7.add_scatter(row=1, col=1, name='Total', x=param['months'],
+    fig7.add_scatter(row=1, col=1, name='Total', x=ais_month.index,
                      y=ais_month['all'], marker_color=tl)
-    fig7.add_scatter(row=1, col=2, name='Filtered', x=param['months'],
+    fig7.add_scatter(row=1, col=2, name='Filtered', x=ais_month.index,
                      y=ais_month['filtered'], marker_color=yl)
     fig7.update_layout(
         title='AIS: Number of Entries',
@@ -253,7 +270,7 @@ def plots(ais_dict, icoads_dict, param, test_numbers):
     fig14.update_traces(texttemplate='%{value}',
                         textposition='outside')
 
-    # save to file as interactive html and png
+    # save to file as interactive html and png (see plotexport)
     figs = {'AIS_Funnel Plots_Filtering Effectiveness': fig1,
             'AIS_Filtering Effectiveness_Unique Ships': fig2,
             'AIS_Scrubbing_Unique Destination': fig3,
@@ -268,6 +285,4 @@ def plots(ais_dict, icoads_dict, param, test_numbers):
             'Operational Downtime by Month_Split': fig12,
             'Operational Downtime due to Weather by Month_Overall': fig13,
             'Estimated Yearly Test Number': fig14}
-    for key, value in figs.items():
-        value.write_image('plots/'+key+'.png', scale=6)
-        value.write_html('plots/'+key+'.html')
+    return plotexport(param, figs)
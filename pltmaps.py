@@ -11,7 +11,15 @@ Created on May 2020
 Program to plot maps for GTN Planning Tool
 Example of Humber Esturary given
 Uses Cartopy and Natural Earth Data
+
+Natural Earth layers within the map extent are projected to the map once
+(basemap) and kept in datafolder/cache, keyed by extent, layers and
+CACHE_VERSION (see stagecache), so each map only draws the projected
+geometries and the bounds and bouy overlays
 """
+import os
+import hashlib
+import pickle as pkl
 
 import cartopy.crs as ccrs
 import cartopy.feature as cf
@@ -19,20 +27,61 @@ import matplotlib.pyplot as plt
 import matplotlib.patches as mpatch
 from matplotlib.lines import Line2D
 
+from stagecache import CACHE_VERSION, atomicwrite
+
+# map extent [W, E, N, S] (lon, lat)
+EXTENT = [-1.5, 3, 54.5, 52.5]
+# basemap layers, Natural Earth (category, name, scale) and style
+# oceans (under bounds, zorder as cf.OCEAN), rivers, lakes
+LAYERS = [(('physical', 'ocean', '50m'), {'color': '#3f5d73', 'zorder': -1}),
+          (('physical', 'rivers_lake_centerlines', '10m'),
+           {'edgecolor': '#87a0b2', 'facecolor': 'none'}),
+          (('physical', 'lakes', '10m'), {'color': '#87a0b2'}),
+          (('physical', 'rivers_europe', '10m'),
+           {'edgecolor': '#87a0b2', 'facecolor': 'none'})]
+# basemaps read from cache in this run (by cache file)
+BASEMAPS = {}
+
+
+def basemap(param, proj, extent=EXTENT):
+
+    # geometries of each layer intersecting extent projected to proj (as
+    # add_feature draws them, not clipped so edges are drawn the same), read
+    # from cache or built and saved to cache
+    key = hashlib.sha1(repr([CACHE_VERSION, extent,
+                             [layer for layer, _ in LAYERS],
+                             proj.proj4_init]).encode()).hexdigest()[:16]
+    path = param['datafolder'] / 'cache' / ('basemap_' + key + '.pkl')
+    if path in BASEMAPS:
+        return BASEMAPS[path]
+    if os.path.exists(path):
+        with open(path, 'rb') as file:
+            BASEMAPS[path] = pkl.load(file)
+        return BASEMAPS[path]
+
+    west, east, north, south = extent
+    layers = []
+    for layer, _ in LAYERS:
+        feature = cf.NaturalEarthFeature(*layer)
+        geoms = [proj.project_geometry(geom, feature.crs)
+                 for geom in feature.intersecting_geometries(
+                     [min(west, east), max(west, east),
+                      min(north, south), max(north, south)])]
+        layers.append([geom for geom in geoms if not geom.is_empty])
+    # only complete basemap is saved (see atomicwrite)
+    atomicwrite(path, lambda file: pkl.dump(layers, file))
+    BASEMAPS[path] = layers
+    return layers
+
 
-def pltmaps(ais_bounds, weather_bounds, param, bouy_loc):
+def pltmaps(ais_bounds, weather_bounds, param, bouy_loc, name='map'):
 
     # create plot
     fig, ax = plt.subplots(subplot_kw=dict(projection=ccrs.OSGB()))
-    extn = [-1.5, 3, 54.5, 52.5]
-    ax.set_extent(extn)
-    # add oceans, rivers, lakes
-    ax.add_feature(cf.OCEAN.with_scale('50m'), color='#3f5d73')
-    ax.add_feature(cf.RIVERS.with_scale('10m'), edgecolor='#87a0b2')
-    ax.add_feature(cf.LAKES.with_scale('10m'), color='#87a0b2')
-    ax.add_feature(cf.NaturalEarthFeature('physical', 'rivers_europe', '10m',
-                                          edgecolor='#87a0b2',
-                                          facecolor=''))
+    ax.set_extent(EXTENT)
+    # add oceans, rivers, lakes from basemap (already in map projection)
+    for (_, style), geoms in zip(LAYERS, basemap(param, ax.projection)):
+        ax.add_geometries(geoms, ax.projection, **style)
 
     # Lambda to draw rectangles
     rect_draw = lambda loc, w, h, ecol, fcol, alpha: mpatch.Rectangle(
@@ -78,5 +127,6 @@ def pltmaps(ais_bounds, weather_bounds, param, bouy_loc):
     for text in leg.get_texts():
         plt.setp(text, color='#3f5d73')
 
-    # save figure to file
-    fig.savefig(param['plotsfolder']/'map.png')
+    # save figure to file, closed so many maps can be drawn
+    fig.savefig(param['plotsfolder']/(name + '.png'))
+    plt.close(fig)
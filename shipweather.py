@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+shipweather
+
+GTN Planning Tool
+Created on May 2020
+@author: Callum Gilmour
+
+Joins arrival of each ship with weather at that time
+Arrival is the first in bounds AIS timestamp of each ship in each year,
+matched to the hourly check flags (icoadsflags) of the hour it falls in with
+a sorted (as-of) merge, so ships arriving while system could operate are
+counted directly rather than assuming arrivals are independent of weather
+Ships tested are counted for each year, tested is the mean of years (float
+for any number of years)
+"""
+import pandas as pd
+
+# check flags joined (see icoadsflags)
+CHECKS = ['avg', 'every']
+
+
+def shipweather(ais_data, fhour):
+
+    # first in bounds timestamp of each ship in each year (UTC, tz naive
+    # as ICOADS)
+    first = ais_data.groupby(['IMO', ais_data['date'].dt.year.rename(
+        'year')])['date'].min()
+    if first.dt.tz is not None:
+        first = first.dt.tz_convert(None)
+    first = first.sort_values().reset_index()
+    # hourly check flags
+    check = pd.DataFrame({key: fhour[('check', key)].values
+                          for key in CHECKS})
+    check.insert(0, 'datetime', fhour[('datetime', '')].values)
+    # each arrival matched to the hour it is in [hour, hour + 1h), ships
+    # arriving outside ICOADS hours are not matched (nan flags)
+    ships = pd.merge_asof(first, check, left_on='date', right_on='datetime',
+                          direction='backward',
+                          tolerance=pd.Timedelta(hours=1) - pd.Timedelta(1))
+    ships = ships.drop(columns='datetime').set_index(['IMO', 'year'])
+    matched = ships[CHECKS[0]].notna()
+    # number of ships arriving in operable hours for each check, in each
+    # year and mean of years
+    years = (pd.DataFrame({key: ships[key].where(matched, False)
+                           .astype(bool) for key in CHECKS})
+             .assign(matched=matched).groupby(level='year').sum())
+    tested = {key: float(years[key].mean()) for key in years}
+    return {'ships': ships, 'tested': tested, 'years': years}
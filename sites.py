@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+sites
+
+GTN Planning Tool
+Created on May 2020
+@author: Callum Gilmour
+
+Search over candidate sites (centre, orientation and bounds size)
+AIS is scrubbed once for a box covering every candidate, as scrubbing is done
+entry by entry the entries of any candidate are those of the covering box
+within the candidates bounds, so ships in each candidate are counted from
+the same scrubbed entries without rerunning the pipeline
+Ships are counted in each year (a ship seen in two years counts in both)
+and ships of a candidate are the mean of years
+Candidates are counted in a pool of worker processes, entries are sent once
+to each worker and tasks are chunks of candidate bounds
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from bounds import boundsbatch
+
+# orientations of port (see bounds)
+ORIENS = ['N', 'E', 'S', 'W', 'mid']
+# entries of worker process (see siteinit)
+ENTRIES = ()
+
+
+def sitegrid(param, centres, oriens, sizes):
+
+    # every combination of centre (lat, lon), orientation and size (out,
+    # along) NM with its AIS bounds [N, E, S, W]
+    grid = pd.DataFrame(
+        [[centre[0], centre[1], orien, size[0], size[1]]
+         for centre in centres for orien in oriens for size in sizes],
+        columns=['lat', 'lon', 'orien', 'out', 'along'])
+    # bounds of all candidates at once (see boundsbatch)
+    box = boundsbatch(grid[['lat', 'lon']].values, grid['orien'].values,
+                      grid[['out', 'along']].values)
+    return grid.assign(N=box[:, 0], E=box[:, 1], S=box[:, 2], W=box[:, 3])
+
+
+def siteships(lat, lon, ship, boxes):
+
+    # number of ships with entries in each box [N, E, S, W] (strictly
+    # inside as cacheread), entries sorted by lat so only lat range of box
+    # is searched, ship: number of ship (0 to ships-1, ship in each year) of
+    # each entry
+    ships = []
+    for box in boxes:
+        first = np.searchsorted(lat, box[2], side='right')
+        last = np.searchsorted(lat, box[0], side='left')
+        inside = (lon[first:last] < box[1]) & (lon[first:last] > box[3])
+        ships.append(len(np.unique(ship[first:last][inside])))
+    return ships
+
+
+def siteinit(*entries):
+
+    # entries (lat, lon, ship) sent once to each worker when pool starts,
+    # so tasks only carry boxes
+    global ENTRIES
+    ENTRIES = entries
+
+
+def siteworker(boxes):
+
+    # ships in each box from entries of worker (see siteinit)
+    return siteships(*ENTRIES, boxes)
+
+
+def sites(ais_data, candidates, workers=None):
+
+    # ships in bounds of each candidate (from sitegrid), counted in chunks
+    # (four per worker) in a pool of workers (None: one per cpu, 1: no
+    # pool)
+    order = np.argsort(ais_data['lat'].values, kind='stable')
+    # ship in each year numbered (IMO and year of entry)
+    year = ais_data['date'].dt.year.values[order]
+    imo = ais_data['IMO'].values[order].astype(np.int64)
+    entries = [ais_data['lat'].values[order], ais_data['lon'].values[order],
+               np.unique(imo*10000 + year, return_inverse=True)[1]]
+    boxes = candidates[['N', 'E', 'S', 'W']].values
+    if workers == 1:
+        ships = siteships(*entries, boxes)
+    else:
+        chunks = np.array_split(boxes, min(len(boxes),
+                                           4*(workers or os.cpu_count())))
+        with ProcessPoolExecutor(max_workers=workers, initializer=siteinit,
+                                 initargs=entries) as pool:
+            ships = sum(pool.map(siteworker, chunks), [])
+    # mean ships of years
+    return candidates.assign(ships=np.array(ships) / len(np.unique(year)))
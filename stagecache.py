@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+stagecache
+
+GTN Planning Tool
+Created on May 2020
+@author: Callum Gilmour
+
+Cache for results of each stage of analysis (see main)
+Stages are saved as pickles in datafolder/cache named by stage and key
+Key is a hash of everything the stage depends on:
+    parameters it uses (values from paramimp)
+    input files (name, size and modified time)
+    other dependencies (e.g. bounds, keys of upstream stages)
+So changing a parameter only reruns stages which use it, and stages
+downstream of them, all other stages are retrived from file
+Caches built from input files (raw columnar caches, spatial and IMO index)
+are keyed by rawkey, which also covers the columns and types files are read
+as and CACHE_VERSION, stages using them take the raw key as a dependency
+"""
+import os
+import hashlib
+import pickle as pkl
+
+# version of caches built from input files, raise when how files are parsed
+# or cached changes so caches built before are rebuilt
+CACHE_VERSION = 1
+
+
+def filekey(path):
+
+    # fingerprint of input file, changes if file is edited or replaced
+    stat = os.stat(path)
+    file = repr([os.path.basename(path), stat.st_size, stat.st_mtime_ns])
+    return hashlib.sha1(file.encode()).hexdigest()[:16]
+
+
+def rawkey(path, types):
+
+    # key of cache built from input file: file fingerprint, columns (in
+    # order) and types it is read as, and CACHE_VERSION
+    parts = [CACHE_VERSION, filekey(path), list(types.items())]
+    return hashlib.sha1(repr(parts).encode()).hexdigest()[:16]
+
+
+def stagekey(param, name, keys=(), files=(), deps=()):
+
+    # keys: param keys used, files: param keys of input files in datafolder
+    # deps: anything else stage depends on (must have stable repr)
+    parts = [name,
+             [(key, param[key]) for key in keys],
+             [filekey(param['datafolder'] / param[key]) for key in files],
+             list(deps)]
+    return hashlib.sha1(repr(parts).encode()).hexdigest()[:16]
+
+
+def atomicwrite(path, writer):
+
+    # write file with writer(file) to a temp file of this process then
+    # replace, so only complete files are saved and workers writing the
+    # same file at once do not clash
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = '%s.%d.tmp' % (path, os.getpid())
+    with open(tmp, 'wb') as file:
+        writer(file)
+    os.replace(tmp, path)
+
+
+def stage(param, name, key, func):
+
+    # retrive stage result from file or run func() and save to file
+    path = param['datafolder'] / 'cache' / (name + '_' + key + '.pkl')
+    if os.path.exists(path):
+        with open(path, 'rb') as file:
+            return pkl.load(file)
+    result = func()
+    atomicwrite(path, lambda file: pkl.dump(result, file))
+    return result
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+visits
+
+GTN Planning Tool
+Created on May 2020
+@author: Callum Gilmour
+
+Vessel tracks and visits from AIS positions
+Positions of each ship (IMO) are sorted by time into a track, which is split
+into separate visits where there is a gap of more than param['visitgap']
+hours between positions
+A visit is a port call if the ship is stopped (speed below
+param['callspeed'] knots) for at least param['calltime'] hours, otherwise it
+is a transit
+All ships are handled at once as arrays (sorted by IMO then time) with
+reduceat over visits, no loop over ships
+"""
+import numpy as np
+import pandas as pd
+
+
+def aisvisits(param, ais_data):
+
+    # sort positions into tracks, by IMO then time
+    order = np.lexsort((ais_data['date'].values, ais_data['IMO'].values))
+    imo = ais_data['IMO'].values[order]
+    date = ais_data['date'].values[order]
+    speed = ais_data['speed'].values[order]
+    dest = ais_data['dest'].values[order]
+    # time to next position (hours)
+    step = np.diff(date) / np.timedelta64(1, 'h')
+    # new visit at start of each track or after gap in track
+    new = np.r_[True, (imo[1:] != imo[:-1]) | (step > param['visitgap'])]
+    start = np.flatnonzero(new)
+    end = np.r_[start[1:], len(imo)] - 1
+    # time stopped in each visit, time to next position in same visit
+    # while speed below limit
+    step = np.where(new[1:], 0, step)
+    stopped = np.add.reduceat(np.r_[step, 0]*(speed < param['callspeed']),
+                              start)
+    # visit table, port is last destination given in visit
+    visits = pd.DataFrame({'IMO': imo[start],
+                           'entry': date[start],
+                           'exit': date[end],
+                           'port': dest[end],
+                           'positions': end - start + 1,
+                           'stopped': stopped})
+    visits['call'] = visits['stopped'] >= param['calltime']
+    # dates as numpy are UTC, keep time zone of AIS dates
+    if ais_data['date'].dt.tz is not None:
+        for col in ['entry', 'exit']:
+            visits[col] = (visits[col].dt.tz_localize('UTC')
+                           .dt.tz_convert(ais_data['date'].dt.tz))
+    return visits